@@ -2,15 +2,134 @@ import random
 import os
 import time
 import math
+import mmap
+import struct
+import sys
+import argparse
+import cProfile
+import sqlite3
+from array import array
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# dimensions of the standard game board
+NUM_ROWS = 6
+NUM_COLUMNS = 7
+# number of pieces in a row that wins the standard game
+CONNECT_LENGTH = 4
+# every bitboard column stores NUM_ROWS cells plus an empty sentinel bit on top,
+# so a line of pieces can never wrap from the top of one column into the next
+BITBOARD_HEIGHT = NUM_ROWS + 1
+# bit index of the sentinel cell on top of every column, reached once a column is full
+BITBOARD_TOPS = tuple(col * BITBOARD_HEIGHT + NUM_ROWS for col in range(NUM_COLUMNS))
+# mask with every playable cell set, used to detect a full board
+BITBOARD_FULL = sum(
+    ((1 << NUM_ROWS) - 1) << (col * BITBOARD_HEIGHT) for col in range(NUM_COLUMNS)
+)
+# mask with the bottom cell of every column set
+BITBOARD_BOTTOM = sum(1 << (col * BITBOARD_HEIGHT) for col in range(NUM_COLUMNS))
+
+# number of cells on the board, the most moves a game can last
+NUM_CELLS = NUM_ROWS * NUM_COLUMNS
+# mask of the playable cells of every column
+BITBOARD_COLUMNS = tuple(
+    ((1 << NUM_ROWS) - 1) << (col * BITBOARD_HEIGHT) for col in range(NUM_COLUMNS)
+)
+# bit of every cell of a Position in the layout of a Bitboard, with the cells
+# numbered row by row from the top like the 2D list board
+POSITION_CELL_BITS = tuple(
+    1 << (cell % NUM_COLUMNS * BITBOARD_HEIGHT + NUM_ROWS - 1 - cell // NUM_COLUMNS)
+    for cell in range(NUM_CELLS)
+)
+
+# the bits of the left columns in a Bitboard.key, sentinel included, with the distance
+# to their mirror image on the right, and the bits of the middle column that stays put
+MIRROR_GROUPS = tuple(
+    (
+        ((1 << BITBOARD_HEIGHT) - 1) << (col * BITBOARD_HEIGHT),
+        (NUM_COLUMNS - 1 - 2 * col) * BITBOARD_HEIGHT,
+    )
+    for col in range(NUM_COLUMNS // 2)
+)
+MIRROR_MIDDLE = (
+    ((1 << BITBOARD_HEIGHT) - 1) << (NUM_COLUMNS // 2 * BITBOARD_HEIGHT)
+    if NUM_COLUMNS % 2
+    else 0
+)
+
+# score of a win, reduced by the number of pieces on the board so faster wins score higher
+WIN_SCORE = 1000000
+# the order search tries columns in, from the middle column outwards
+CENTER_FIRST_ORDER = tuple(
+    sorted(
+        range(1, NUM_COLUMNS + 1), key=lambda column: abs(column - NUM_COLUMNS // 2 - 1)
+    )
+)
+# default time budget in seconds of an expert move
+EXPERT_TIME_LIMIT = 0.1
+# default memory cap of a transposition table in megabytes
+TRANSPOSITION_TABLE_MB = 16
+# default number of positions a HardMoveCache remembers the move of
+HARD_MOVE_CACHE_ENTRIES = 100000
+# opening book file read by the expert CPU, written by "python connect4.py book"
+OPENING_BOOK_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "connect4_book.bin"
+)
+# default number of moves from the start of the game the opening book covers
+OPENING_BOOK_PLIES = 4
+# default seconds spent searching each position when generating the opening book
+OPENING_BOOK_TIME_LIMIT = 1.0
+# database of positions solved by solve, and the most positions it keeps
+SOLVER_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "connect4_solved.sqlite"
+)
+SOLVER_CACHE_ENTRIES = 1000000
+# default time budget in seconds of a Monte Carlo tree search move
+MCTS_TIME_LIMIT = 1.0
+# weight of exploring rarely visited moves against playing well scoring ones in UCT
+MCTS_EXPLORATION = math.sqrt(2)
+# number of tournament games each worker process plays per batch
+TOURNAMENT_CHUNK_SIZE = 50
+# default number of games played out after each column when analyze_moves scores
+# the columns with a CPU strategy
+ANALYSIS_PLAYOUTS = 200
+# weights of the counts that evaluate scores a position by
+OPEN_TWO_SCORE = 1
+OPEN_THREE_SCORE = 4
+CENTER_SCORE = 3
+THREAT_PARITY_SCORE = 8
+# game record archive that play --record appends the menu games to and records reads
+# by default, see GameRecordWriter
+GAME_RECORD_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "connect4_games.c4r"
+)
+# kinds of game a record archive tells apart
+RECORD_HEADLESS = 0
+RECORD_LOCAL = 1
+RECORD_AGAINST_CPU = 2
+# bytes of records a GameRecordWriter holds before writing them out, and read at once
+GAME_RECORD_BUFFER_SIZE = 1 << 16
+GAME_RECORD_CHUNK_SIZE = 1 << 20
+# ANSI escape sequence that moves the cursor to the top left and clears the terminal
+CLEAR_SCREEN = "\033[H\033[2J"
+# default seconds the final board of a game stays up before returning to the menu
+RETURN_TO_MENU_DELAY = 3
+# kinds of score a transposition table entry can hold
+EXACT_SCORE = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
 
 
 def clear_screen():
     """
-    Clears the terminal for Windows and Linux/MacOS.
+    Clears the terminal with an ANSI escape sequence, instead of running
+    a separate clear or cls program for every redraw.
 
     :return: None
     """
-    os.system("cls" if os.name == "nt" else "clear")
+    sys.stdout.write(CLEAR_SCREEN)
+    sys.stdout.flush()
 
 
 def print_rules():
@@ -56,18 +175,20 @@ def validate_input(prompt, valid_inputs):
     return user_input
 
 
-def create_board():
+def create_board(num_rows=NUM_ROWS, num_columns=NUM_COLUMNS):
     """
-    Returns a 2D list of 6 rows and 7 columns to represent
-    the game board. Default cell value is 0.
+    Returns a 2D list of 6 rows and 7 columns, or of the given
+    dimensions, to represent the game board. Default cell value is 0.
 
-    :return: A 2D list of 6x7 dimensions.
+    :param num_rows: Number of rows of the board, int.
+    :param num_columns: Number of columns of the board, int.
+    :return: A 2D list of 6x7 dimensions, or of the given dimensions.
     """
     board = []  # creating a list "board"
-    for row in range(1, 7):  # range(1,7) will runs 6 times creating 6 rows.
+    for row in range(num_rows):  # the loop runs once for every row
         board.append(
-            [0] * 7
-        )  # everytime the loop is ran, 7x [0] will be append to each row.
+            [0] * num_columns
+        )  # everytime the loop is ran, a row of empty cells is appended.
     return board
 
 
@@ -75,14 +196,37 @@ def print_board(board):
     """
     Prints the game board to the console.
 
-    :param board: The game board, 2D list of 6x7 dimensions.
+    :param board: The game board, 2D list of 6x7 dimensions, a Bitboard or a Position.
     :return: None
     """
-    print("========== Connect4 =========")  # displays the game title and player info
-    print("Player 1: X       Player 2: O")
-    print()  # prints a blank line
-    print("  1   2   3   4   5   6   7")
-    print(" --- --- --- --- --- --- ---")
+    print(format_board(board))
+
+
+def format_board(board):
+    """
+    Draws the game board as text.
+
+    :param board: The game board, 2D list of 6x7 dimensions, a Bitboard or a Position.
+    :return: The lines of the drawing, string.
+    """
+    if isinstance(board, (Bitboard, Position)):
+        board = board.to_board()
+
+    # every column takes four characters, plus the border on the right
+    width = 4 * len(board[0]) + 1
+    title_padding = width - len(" Connect4 ")
+    separator = " ---" * len(board[0])
+    lines = [
+        "=" * ((title_padding + 1) // 2)
+        + " Connect4 "
+        + "=" * (title_padding // 2),  # displays the game title and player info
+        "Player 1: X       Player 2: O",
+        "",  # a blank line
+        "".join(
+            " {:^3}".format(column) for column in range(1, len(board[0]) + 1)
+        ).rstrip(),
+        separator,
+    ]
 
     for row in board:
         row_str = (
@@ -95,11 +239,26 @@ def print_board(board):
                 row_str += " X |"  # if the value is 1 X is added
             else:
                 row_str += " O |"  # if the value is 2 O is added
-        print(row_str)  # prints the complete row
-        print(
-            " --- --- --- --- --- --- ---"
-        )  # displays a horizontal line after each row
-    print("=============================")
+        lines.append(row_str)  # adds the complete row
+        lines.append(separator)  # displays a horizontal line after each row
+    lines.append("=" * width)
+    return "\n".join(lines)
+
+
+def render_game(game, message=""):
+    """
+    Redraws the terminal with the board of a game and a message below
+    it, written out at once so the screen does not flicker.
+
+    :param game: The game to show, Game.
+    :param message: Text shown below the board, string.
+    :return: None
+    """
+    frame = CLEAR_SCREEN + format_board(game.board) + "\n"
+    if message:
+        frame += message + "\n"
+    sys.stdout.write(frame)
+    sys.stdout.flush()
 
 
 def drop_piece(board, player, column):
@@ -108,44 +267,121 @@ def drop_piece(board, player, column):
     Please note that this function expects the column index
     to start at 1.
 
-    :param board: The game board, 2D list of 6x7 dimensions.
+    :param board: The game board, 2D list of 6x7 dimensions or a Bitboard.
     :param player: The player who is dropping the piece, int.
     :param column: The index of column to drop the piece into, int.
     :return: True if piece was successfully dropped, False if not.
     """
-    success = False  # declaring a variable called "success" to
+    if isinstance(board, Bitboard):
+        return board.drop(player, column)
+
+    return make_move(board, player, column) is not None
+
+
+def make_move(board, player, column):
+    """
+    Drops a piece into the game board in the given column and
+    returns where it landed, so the move can later be taken back
+    with unmake_move. Please note that this function expects the
+    column index to start at 1.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param player: The player who is dropping the piece, int.
+    :param column: The index of column to drop the piece into, int.
+    :return: Row index the piece landed in starting at 0 from the top, int, or None if the column is full.
+    """
+    # search from the bottom of the column up for the first empty cell
+    for row_index in range(len(board) - 1, -1, -1):
+        if board[row_index][column - 1] == 0:
+            board[row_index][column - 1] = player
+            return row_index
+    return None
+
+
+def unmake_move(board, row, column):
+    """
+    Takes back a move made with make_move, restoring the cell
+    to empty. Please note that this function expects the column
+    index to start at 1.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param row: Row index returned by make_move, int.
+    :param column: The index of column the piece was dropped into, int.
+    :return: None
+    """
+    board[row][column - 1] = 0
+
+
+def undo_piece(board, column):
+    """
+    Removes the top piece from the given column.
+    Please note that this function expects the column index
+    to start at 1.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param column: The index of column to remove the piece from, int.
+    :return: True if a piece was removed, False if the column was empty.
+    """
+    row = get_piece_row(board, column)
+    if row is None:
+        return False
+    board[row][column - 1] = 0
+    return True
+
+
+def is_column_full(board, column):
+    """
+    Checks if a column has no room left for a piece. Pieces stack up
+    from the bottom, so only the top cell of the column is looked at.
+    Please note that this function expects the column index to start
+    at 1.
+
+    :param board: The game board, 2D list of 6x7 dimensions, a Bitboard or a Position.
+    :param column: The index of column to check, int.
+    :return: True if the column is full, False if not.
+    """
+    if isinstance(board, (Bitboard, Position)):
+        return not board.can_drop(column)
+    return board[0][column - 1] != 0
 
-    for i in range(len(board) - 1, -1, -1):  #
-        while success == False:
-            if board[i][column - 1] == 0:
-                board[i][column - 1] = player
-                success = True
-            break
 
-    return success
+def legal_moves(board):
+    """
+    Lists the columns a piece can be dropped into.
+
+    :param board: The game board, 2D list of 6x7 dimensions, a Bitboard or a Position.
+    :return: The columns that are not full, starting at 1, list of ints.
+    """
+    if isinstance(board, (Bitboard, Position)):
+        return board.legal_moves()
+    return [column for column, cell in enumerate(board[0], 1) if cell == 0]
 
 
-def execute_player_turn(player, board):
+def execute_player_turn(game):
     """
-    Prompts user for a legal move given the current game board
-    and executes the move.
+    Prompts the player to move for a legal move in the game
+    and applies the move.
 
+    :param game: The game being played, Game.
     :return: Column that the piece was dropped into, int.
     """
+    player = game.player
+    columns = [str(column) for column in range(1, game.variant.num_columns + 1)]
     # user_column_input responsiblity is to hold the valid column number from validate_input
     user_column_input = validate_input(
         "Player "
         + str(player)
         + ", please enter the column you would like to drop your piece into: ",
-        ["1", "2", "3", "4", "5", "6", "7"],
+        columns,
     )
     # is_drop_piece_successful is a boolean to check whether or not the piece was dropped successfully. Starts off as False
     is_drop_piece_successful = False
 
     # A while loop that continues asking for a column input from the user until user inputs a column number that a drop piece can successfully be placed
     while not is_drop_piece_successful:
-        # checks if the drop piece was successful or not in the column
-        if drop_piece(board, player, int(user_column_input)):
+        # checks if the column still has room for a piece
+        if not game.is_column_full(int(user_column_input)):
+            game.apply_move(int(user_column_input))
             # set is_drop_piece_successful to true to end loop as piece can be dropped in the column user requested
             is_drop_piece_successful = True
         else:
@@ -156,90 +392,37 @@ def execute_player_turn(player, board):
                 "Player "
                 + str(player)
                 + ", please enter the column you would like to drop your piece into: ",
-                ["1", "2", "3", "4", "5", "6", "7"],
+                columns,
             )
 
     # when drop piece is successful, return the column number the user input but as an integer
     return int(user_column_input)
 
 
-def end_of_game(board):
+def end_of_game(board, variant=None):
     """
     Checks if the game has ended with a winner
     or a draw.
 
-    :param board: The game board, 2D list of 6 rows x 7 columns.
+    :param board: The game board, 2D list of 6 rows x 7 columns, a Bitboard or a Position.
+    :param variant: Rules of the game on the board, Variant or None for the standard game.
     :return: 0 if game is not over, 1 if player 1 wins, 2 if player 2 wins, 3 if draw.
     """
-    # both variables are constants since neither value ever changes
-    # number of rows in the board
-    NUM_ROWS = len(board)
-    # number of columns in the board
-    NUM_COLUMNS = len(board[1])
-
-    # Check for vertical win
-    # rows range is subtracted by 3, so we don't go out of index range
-    for row_index in range(NUM_ROWS - 3):
-        for col_index in range(NUM_COLUMNS):
-            if (
-                board[row_index][col_index]
-                == board[row_index + 1][col_index]
-                == board[row_index + 2][col_index]
-                == board[row_index + 3][col_index]
-                and board[row_index][col_index] != 0
-            ):
-                if board[row_index][col_index] == 1:
-                    return 1
-                else:
-                    return 2
-
-    # Check for horizontal win
-    # columns range is subtracted by 3, so we don't go out of index range
-    for row_index in range(NUM_ROWS):
-        for col_index in range(NUM_COLUMNS - 3):
-            if (
-                board[row_index][col_index]
-                == board[row_index][col_index + 1]
-                == board[row_index][col_index + 2]
-                == board[row_index][col_index + 3]
-                and board[row_index][col_index] != 0
-            ):
-                if board[row_index][col_index] == 1:
-                    return 1
-                else:
-                    return 2
-
-    # Check for diagonal win if its from top-left to bottom right
-    # row range is from 0 to 3 because in this instance, this is the only possible combinations of a diagonal
-    for row_index in range(0, 3):
-        for col_index in range(0, 4):
-            if (
-                board[row_index][col_index]
-                == board[row_index + 1][col_index + 1]
-                == board[row_index + 2][col_index + 2]
-                == board[row_index + 3][col_index + 3]
-                and board[row_index][col_index] != 0
-            ):
-                if board[row_index][col_index] == 1:
-                    return 1
-                else:
-                    return 2
-
-    # Check for diagonal win if its from bottom-left to top-right
-    # rows start at index 3 because that is the beginning of a possible diagonal
-    for row_index in range(3, NUM_ROWS):
-        for col_index in range(0, 4):
-            if (
-                board[row_index][col_index]
-                == board[row_index - 1][col_index + 1]
-                == board[row_index - 2][col_index + 2]
-                == board[row_index - 3][col_index + 3]
-                and board[row_index][col_index] != 0
-            ):
-                if board[row_index][col_index] == 1:
-                    return 1
-                else:
-                    return 2
+    if isinstance(board, (Bitboard, Position)):
+        return board.result()
+
+    has_connection = has_four_in_a_row
+    height = BITBOARD_HEIGHT
+    if variant is not None:
+        has_connection = variant.has_connection
+        height = variant.bitboard_height
+    # pack both players' pieces into bitmasks in a single pass over the board,
+    # then every vertical, horizontal and diagonal line is checked at once
+    player_1_mask, player_2_mask = board_to_bitmasks(board, height)
+    if has_connection(player_1_mask):
+        return 1
+    if has_connection(player_2_mask):
+        return 2
 
     # checks if the board is over or a draw or is still going
     for row in board:
@@ -248,58 +431,731 @@ def end_of_game(board):
     return 3
 
 
-def local_2_player_game():
+def get_piece_row(board, column):
+    """
+    Finds the row of the top piece in the given column.
+    Please note that this function expects the column index
+    to start at 1.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param column: The index of column to look in, int.
+    :return: Row index of the top piece starting at 0 from the top, int, or None if the column is empty.
+    """
+    for row_index in range(len(board)):
+        if board[row_index][column - 1] != 0:
+            return row_index
+    return None
+
+
+def check_move_result(board, row, col, move_count=None, connect=CONNECT_LENGTH):
+    """
+    Checks if the piece that was just placed ended the game.
+    Unlike end_of_game, only the four lines passing through the
+    placed piece are checked, since any new four in a row has
+    to include it.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param row: Row index of the placed piece starting at 0 from the top, int.
+    :param col: Column index of the placed piece starting at 0, int.
+    :param move_count: Number of pieces on the board including this one, int.
+        When not given, a draw is detected by checking the top row for space.
+    :param connect: Number of pieces in a row that wins, int.
+    :return: 0 if game is not over, 1 if player 1 wins, 2 if player 2 wins, 3 if draw.
+    """
+    num_rows = len(board)
+    num_columns = len(board[0])
+    player = board[row][col]
+
+    # vertical, horizontal, top-left to bottom-right and bottom-left to top-right
+    for row_step, col_step in ((1, 0), (0, 1), (1, 1), (-1, 1)):
+        connected = 1
+        # count the player's pieces on both sides of the placed piece
+        for direction in (1, -1):
+            row_index = row + row_step * direction
+            col_index = col + col_step * direction
+            while (
+                0 <= row_index < num_rows
+                and 0 <= col_index < num_columns
+                and board[row_index][col_index] == player
+            ):
+                connected += 1
+                row_index += row_step * direction
+                col_index += col_step * direction
+        if connected >= connect:
+            return player
+
+    if move_count is not None:
+        return 3 if move_count == num_rows * num_columns else 0
+    return 0 if 0 in board[0] else 3
+
+
+def has_four_in_a_row(mask):
+    """
+    Checks whether a bitmask of one player's pieces contains four in a row.
+    Shifting by one step of a line lines each cell up with its neighbour,
+    so two shift-and-AND steps leave a bit set only where four pieces meet.
+
+    :param mask: The pieces of one player, int in bitboard layout.
+    :return: True if the pieces contain four in a row, False if not.
+    """
+    # vertical
+    pairs = mask & (mask >> 1)
+    if pairs & (pairs >> 2):
+        return True
+    # horizontal
+    height = BITBOARD_HEIGHT
+    pairs = mask & (mask >> height)
+    if pairs & (pairs >> (2 * height)):
+        return True
+    # diagonal from top-left to bottom-right
+    pairs = mask & (mask >> (height - 1))
+    if pairs & (pairs >> (2 * height - 2)):
+        return True
+    # diagonal from bottom-left to top-right
+    pairs = mask & (mask >> (height + 1))
+    return pairs & (pairs >> (2 * height + 2)) != 0
+
+
+def has_n_in_a_row(mask, height, connect):
+    """
+    Checks whether a bitmask of one player's pieces contains connect
+    pieces in a row, on a board of any size. Like has_four_in_a_row,
+    every shift-and-AND step doubles the length of the runs of pieces
+    left in the mask, until they are connect long.
+
+    :param mask: The pieces of one player, int in bitboard layout.
+    :param height: Bits per column of the bitboard, sentinel included, int.
+    :param connect: Number of pieces in a row that wins, int.
+    :return: True if the pieces contain connect in a row, False if not.
+    """
+    for shift in (1, height, height - 1, height + 1):
+        # a bit of runs is set where length pieces in a row start
+        runs = mask
+        length = 1
+        while length < connect and runs:
+            step = min(length, connect - length)
+            runs &= runs >> (shift * step)
+            length += step
+        if runs:
+            return True
+    return False
+
+
+def board_to_bitmasks(board, height=BITBOARD_HEIGHT):
+    """
+    Converts a 2D list board into one bitmask per player. Bit
+    column * height + row is set when the player owns that cell,
+    where row 0 is the bottom of the column.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param height: Bits per column of the bitboard, sentinel included, int.
+    :return: Bitmasks of player 1 and player 2, tuple of two ints.
+    """
+    player_1_mask = 0
+    player_2_mask = 0
+    bottom_row = len(board) - 1
+    for row_index, row in enumerate(board):
+        # the list board stores the top row first, the bitboard counts from the bottom
+        bit = 1 << (bottom_row - row_index)
+        for cell in row:
+            if cell == 1:
+                player_1_mask |= bit
+            elif cell == 2:
+                player_2_mask |= bit
+            bit <<= height
+    return player_1_mask, player_2_mask
+
+
+class Bitboard:
+    """
+    Compact game board that stores the pieces of each player as the bits
+    of a single int, alongside the height of every column. Dropping and
+    undoing a piece are O(1) and a win is found with a few shifts and ANDs,
+    which makes it far cheaper than the 2D list board for simulating moves.
+
+    Columns are passed in starting at 1, the same as drop_piece.
+    """
+
+    __slots__ = ("pieces", "heights", "history", "moves", "threats")
+
+    def __init__(self):
+        # pieces[1] and pieces[2] hold the bitmasks of player 1 and player 2
+        self.pieces = [0, 0, 0]
+        # heights holds the bit index of the next free cell in every column
+        self.heights = [col * BITBOARD_HEIGHT for col in range(NUM_COLUMNS)]
+        # history holds the columns played on this bitboard so they can be undone
+        self.history = []
+        # moves counts every piece on the board, including ones from from_board
+        self.moves = 0
+        # threats counts the pieces in every line for evaluate while search runs, see track_threats
+        self.threats = None
+
+    @classmethod
+    def from_board(cls, board):
+        """
+        Creates a bitboard holding the same pieces as a 2D list board.
+
+        :param board: The game board, 2D list of 6x7 dimensions.
+        :return: The equivalent position, Bitboard.
+        """
+        bitboard = cls()
+        player_1_mask, player_2_mask = board_to_bitmasks(board)
+        bitboard.pieces[1] = player_1_mask
+        bitboard.pieces[2] = player_2_mask
+        occupied = player_1_mask | player_2_mask
+        bitboard.moves = bin(occupied).count("1")
+        for col in range(NUM_COLUMNS):
+            height = col * BITBOARD_HEIGHT
+            while occupied >> height & 1:
+                height += 1
+            bitboard.heights[col] = height
+        return bitboard
+
+    def to_board(self):
+        """
+        Creates a 2D list board holding the same pieces as this bitboard.
+
+        :return: The game board, 2D list of 6x7 dimensions.
+        """
+        board = create_board()
+        for row_index in range(NUM_ROWS):
+            bit = 1 << (NUM_ROWS - 1 - row_index)
+            for col_index in range(NUM_COLUMNS):
+                if self.pieces[1] & bit:
+                    board[row_index][col_index] = 1
+                elif self.pieces[2] & bit:
+                    board[row_index][col_index] = 2
+                bit <<= BITBOARD_HEIGHT
+        return board
+
+    def copy(self):
+        """
+        Creates an independent copy of this bitboard.
+
+        :return: The copied position, Bitboard.
+        """
+        bitboard = Bitboard()
+        bitboard.pieces = self.pieces[:]
+        bitboard.heights = self.heights[:]
+        bitboard.history = self.history[:]
+        bitboard.moves = self.moves
+        return bitboard
+
+    def track_threats(self):
+        """
+        Starts keeping a ThreatIndex of this position, updated by every
+        drop and undo, so the position can be scored by evaluate without
+        looking at the board. A copy of the bitboard does not keep it.
+
+        :return: The index of this position, ThreatIndex.
+        """
+        if self.threats is None:
+            self.threats = ThreatIndex(self.to_board())
+        return self.threats
+
+    def move_count(self):
+        """
+        Counts the pieces on the board.
+
+        :return: Number of pieces played, int.
+        """
+        return self.moves
+
+    def key(self, player):
+        """
+        Creates a number that identifies this position with the given
+        player to move. Adding the occupied cells to the player's pieces
+        sets the bit above every column's top piece, so no two positions
+        share a key. A position and the same position with the colours
+        swapped and the other player to move get the same key, which is
+        fine since they are worth the same to the player to move.
+
+        :param player: The player to move, int.
+        :return: Key of the position, int that fits in 64 bits.
+        """
+        return self.pieces[player] + (self.pieces[1] | self.pieces[2]) + BITBOARD_BOTTOM
+
+    def can_drop(self, column):
+        """
+        Checks if a piece can be dropped into the given column.
+
+        :param column: The index of column starting at 1, int.
+        :return: True if the column has space left, False if not.
+        """
+        return self.heights[column - 1] != BITBOARD_TOPS[column - 1]
+
+    def drop(self, player, column):
+        """
+        Drops a piece into the given column.
+
+        :param player: The player who is dropping the piece, int.
+        :param column: The index of column starting at 1, int.
+        :return: True if piece was successfully dropped, False if not.
+        """
+        height = self.heights[column - 1]
+        if height == BITBOARD_TOPS[column - 1]:
+            return False
+        self.pieces[player] |= 1 << height
+        self.heights[column - 1] = height + 1
+        self.history.append(column)
+        self.moves += 1
+        if self.threats is not None:
+            self.threats.add(
+                NUM_ROWS - 1 - height % BITBOARD_HEIGHT, column - 1, player
+            )
+        return True
+
+    def legal_moves(self):
+        """
+        :return: The columns that can take a piece, starting at 1, list of ints.
+        """
+        heights = self.heights
+        return [
+            column
+            for column in range(1, NUM_COLUMNS + 1)
+            if heights[column - 1] != BITBOARD_TOPS[column - 1]
+        ]
+
+    def is_winning_drop(self, player, column):
+        """
+        Checks if dropping a piece into the given column would win the game
+        for the player, without changing the board.
+
+        :param player: The player who would drop the piece, int.
+        :param column: The index of column starting at 1, int.
+        :return: True if the drop connects four, False if not.
+        """
+        height = self.heights[column - 1]
+        if height == BITBOARD_TOPS[column - 1]:
+            return False
+        return has_four_in_a_row(self.pieces[player] | 1 << height)
+
+    def undo(self):
+        """
+        Removes the last piece dropped on this bitboard. Pieces that were
+        already on the board when it was created by from_board are not
+        recorded and cannot be undone.
+
+        :return: Column the piece was removed from, int.
+        """
+        column = self.history.pop()
+        height = self.heights[column - 1] - 1
+        self.heights[column - 1] = height
+        self.moves -= 1
+        bit = 1 << height
+        if self.threats is not None:
+            self.threats.remove(
+                NUM_ROWS - 1 - height % BITBOARD_HEIGHT,
+                column - 1,
+                1 if self.pieces[1] & bit else 2,
+            )
+        self.pieces[1] &= ~bit
+        self.pieces[2] &= ~bit
+        return column
+
+    def is_winner(self, player):
+        """
+        Checks if the given player has four in a row.
+
+        :param player: The player to check, int.
+        :return: True if the player has connected four, False if not.
+        """
+        return has_four_in_a_row(self.pieces[player])
+
+    def result(self):
+        """
+        Checks if the game has ended with a winner or a draw.
+
+        :return: 0 if game is not over, 1 if player 1 wins, 2 if player 2 wins, 3 if draw.
+        """
+        if has_four_in_a_row(self.pieces[1]):
+            return 1
+        if has_four_in_a_row(self.pieces[2]):
+            return 2
+        if self.pieces[1] | self.pieces[2] == BITBOARD_FULL:
+            return 3
+        return 0
+
+
+def mirror_key(key):
+    """
+    Finds the key of a position mirrored left to right. Every column
+    has its own group of bits in a key from Bitboard.key, so mirroring
+    swaps the groups of columns the same distance from the middle.
+
+    :param key: Key of the position from Bitboard.key, int.
+    :return: Key of the mirrored position, int.
+    """
+    mirrored = key & MIRROR_MIDDLE
+    for group, shift in MIRROR_GROUPS:
+        mirrored |= (key & group) << shift | (key >> shift) & group
+    return mirrored
+
+
+def canonical_key(key):
+    """
+    Maps a position and its mirror image to the same key, the smaller of
+    their two keys. Stores keyed by position use it so both are stored
+    once, with the columns of the mirror image translated by
+    mirror_column.
+
+    :param key: Key of the position from Bitboard.key, int.
+    :return: The canonical key and whether it is the key of the mirrored position, tuple of int and bool.
+    """
+    mirrored = mirror_key(key)
+    if mirrored < key:
+        return mirrored, True
+    return key, False
+
+
+def mirror_column(column):
+    """
+    :param column: A column starting at 1, or 0 for none, int.
+    :return: The same column on the mirrored board, or 0 for none, int.
+    """
+    return NUM_COLUMNS + 1 - column if column else 0
+
+
+class Position:
+    """
+    Compact game board that keeps the 42 cells in one flat bytearray,
+    row by row from the top like the 2D list board, along with the
+    height of every column, the player to move and the number of pieces
+    played. A position takes a fraction of the memory of a list board
+    and is copied in one step, so millions of them can be held for
+    analysis. Positions with the same pieces and player to move are
+    equal and hash the same, so they can key a dict or go in a set, as
+    long as they are not changed while they do.
+
+    Columns are passed in starting at 1, the same as drop_piece. Moves
+    are always made by the player to move.
+    """
+
+    __slots__ = ("cells", "heights", "player", "moves")
+
+    # bytes taken by to_bytes, one bit for the player to move and two for every cell
+    PACKED_BYTES = (1 + 2 * NUM_CELLS + 7) // 8
+
+    def __init__(self):
+        # cells holds 0, 1 or 2 for every cell, row * NUM_COLUMNS + col for the cell at row, col
+        self.cells = bytearray(NUM_CELLS)
+        # heights counts the pieces in every column
+        self.heights = bytearray(NUM_COLUMNS)
+        self.player = 1
+        self.moves = 0
+
+    @classmethod
+    def from_board(cls, board, player=None):
+        """
+        Creates a position holding the same pieces as a 2D list board.
+
+        :param board: The game board, 2D list of 6x7 dimensions.
+        :param player: The player to move, integer value of 1 or 2, defaults to the one with fewer pieces or player 1.
+        :return: The equivalent position, Position.
+        """
+        position = cls()
+        position.cells = bytearray(cell for row in board for cell in row)
+        for col in range(NUM_COLUMNS):
+            position.heights[col] = sum(1 for row in board if row[col] != 0)
+        position.moves = sum(position.heights)
+        if player is None:
+            player = 2 if position.cells.count(1) > position.cells.count(2) else 1
+        position.player = player
+        return position
+
+    def to_board(self):
+        """
+        Creates a 2D list board holding the same pieces as this position.
+
+        :return: The game board, 2D list of 6x7 dimensions.
+        """
+        cells = self.cells
+        return [
+            list(cells[row * NUM_COLUMNS : (row + 1) * NUM_COLUMNS])
+            for row in range(NUM_ROWS)
+        ]
+
+    def clone(self):
+        """
+        Creates an independent copy of this position.
+
+        :return: The copied position, Position.
+        """
+        position = Position.__new__(Position)
+        position.cells = self.cells[:]
+        position.heights = self.heights[:]
+        position.player = self.player
+        position.moves = self.moves
+        return position
+
+    def __eq__(self, other):
+        if not isinstance(other, Position):
+            return NotImplemented
+        return self.player == other.player and self.cells == other.cells
+
+    def __hash__(self):
+        return hash((bytes(self.cells), self.player))
+
+    def can_drop(self, column):
+        """
+        Checks if a piece can be dropped into the given column.
+
+        :param column: The index of column starting at 1, int.
+        :return: True if the column has space left, False if not.
+        """
+        return self.heights[column - 1] != NUM_ROWS
+
+    def legal_moves(self):
+        """
+        :return: The columns that can take a piece, starting at 1, list of ints.
+        """
+        return [
+            column
+            for column, height in enumerate(self.heights, 1)
+            if height != NUM_ROWS
+        ]
+
+    def drop(self, column):
+        """
+        Drops a piece for the player to move into the given column and
+        passes the turn to the other player.
+
+        :param column: The index of column starting at 1, int.
+        :return: True if piece was successfully dropped, False if not.
+        """
+        height = self.heights[column - 1]
+        if height == NUM_ROWS:
+            return False
+        self.cells[(NUM_ROWS - 1 - height) * NUM_COLUMNS + column - 1] = self.player
+        self.heights[column - 1] = height + 1
+        self.moves += 1
+        self.player = 3 - self.player
+        return True
+
+    def undo(self, column):
+        """
+        Removes the top piece from the given column and gives the turn
+        back to the other player.
+
+        :param column: The index of column starting at 1, int.
+        :return: True if a piece was removed, False if the column was empty.
+        """
+        height = self.heights[column - 1] - 1
+        if height < 0:
+            return False
+        self.cells[(NUM_ROWS - 1 - height) * NUM_COLUMNS + column - 1] = 0
+        self.heights[column - 1] = height
+        self.moves -= 1
+        self.player = 3 - self.player
+        return True
+
+    def bitmasks(self):
+        """
+        :return: Bitmasks of player 1 and player 2 in the layout of board_to_bitmasks, tuple of two ints.
+        """
+        masks = [0, 0, 0]
+        for bit, cell in zip(POSITION_CELL_BITS, self.cells):
+            masks[cell] |= bit
+        return masks[1], masks[2]
+
+    def result(self):
+        """
+        Checks if the game has ended with a winner or a draw.
+
+        :return: 0 if game is not over, 1 if player 1 wins, 2 if player 2 wins, 3 if draw.
+        """
+        player_1_mask, player_2_mask = self.bitmasks()
+        if has_four_in_a_row(player_1_mask):
+            return 1
+        if has_four_in_a_row(player_2_mask):
+            return 2
+        if self.moves == NUM_CELLS:
+            return 3
+        return 0
+
+    def to_bytes(self):
+        """
+        Packs the position into PACKED_BYTES bytes, the player to move in
+        the lowest bit followed by two bits for every cell.
+
+        :return: The packed position, bytes.
+        """
+        packed = 0
+        for cell in reversed(self.cells):
+            packed = packed << 2 | cell
+        return (packed << 1 | self.player - 1).to_bytes(self.PACKED_BYTES, "little")
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Unpacks a position packed by to_bytes.
+
+        :param data: The packed position, bytes.
+        :return: The position, Position.
+        :raises ValueError: If the data is not a packed position.
+        """
+        if len(data) != cls.PACKED_BYTES:
+            raise ValueError(
+                "A packed position takes " + str(cls.PACKED_BYTES) + " bytes"
+            )
+        packed = int.from_bytes(data, "little")
+        position = cls()
+        position.player = (packed & 1) + 1
+        packed >>= 1
+        for cell in range(NUM_CELLS):
+            value = packed & 3
+            if value == 3:
+                raise ValueError("A packed position holds an unknown cell")
+            if value:
+                position.cells[cell] = value
+                position.heights[cell % NUM_COLUMNS] += 1
+            packed >>= 2
+        position.moves = sum(position.heights)
+        return position
+
+
+class Game:
+    """
+    A game of Connect 4 as a state machine without any input or output:
+    the board, the player to move and the result so far. Front ends get
+    moves from people or CPU players, pass them to apply_move and show
+    the board however they like, and headless callers can play game
+    after game on one Game with new_game.
+    """
+
+    __slots__ = (
+        "variant",
+        "board",
+        "heights",
+        "player",
+        "move_count",
+        "game_result",
+        "history",
+    )
+
+    def __init__(self, variant=None):
+        """
+        :param variant: Rules of the game, Variant or None for the standard game.
+        """
+        self.variant = STANDARD_VARIANT if variant is None else variant
+        self.new_game()
+
+    def new_game(self):
+        """
+        Starts the game again from an empty board with player 1 to move.
+
+        :return: None
+        """
+        self.board = create_board(self.variant.num_rows, self.variant.num_columns)
+        # heights counts the pieces in every column, so a move lands without searching the column
+        self.heights = [0] * self.variant.num_columns
+        self.player = 1
+        # move_count counts the pieces on the board, used to detect a draw
+        self.move_count = 0
+        # game_result holds the outcome of the last move, 0 while the game is still going
+        self.game_result = 0
+        # history holds the columns played so far, in order
+        self.history = []
+
+    def legal_moves(self):
+        """
+        :return: The columns the player to move can drop a piece into, starting at 1, list of ints.
+        """
+        if self.game_result != 0:
+            return []
+        num_rows = self.variant.num_rows
+        return [
+            column
+            for column, height in enumerate(self.heights, 1)
+            if height != num_rows
+        ]
+
+    def is_column_full(self, column):
+        """
+        :param column: The column to check, starting at 1, int.
+        :return: True if the column cannot take another piece, False if not.
+        """
+        return self.heights[column - 1] == self.variant.num_rows
+
+    def apply_move(self, column):
+        """
+        Drops a piece for the player to move and passes the turn to the
+        other player.
+
+        :param column: The column to drop the piece into, starting at 1, int.
+        :return: The result of the game after the move, see result.
+        :raises ValueError: If the game is over or the column cannot take a piece.
+        """
+        if self.game_result != 0:
+            raise ValueError("The game is already over")
+        if not 1 <= column <= self.variant.num_columns or self.is_column_full(column):
+            raise ValueError("Column " + str(column) + " is not a legal move")
+        row = self.variant.num_rows - 1 - self.heights[column - 1]
+        self.board[row][column - 1] = self.player
+        self.heights[column - 1] += 1
+        # only the lines through the new piece can have changed the result
+        self.move_count += 1
+        self.game_result = check_move_result(
+            self.board, row, column - 1, self.move_count, self.variant.connect
+        )
+        self.history.append(column)
+        self.player = 3 - self.player
+        return self.game_result
+
+    def result(self):
+        """
+        :return: 0 while the game is still going, 1 if player 1 won, 2 if player 2 won, 3 if draw.
+        """
+        return self.game_result
+
+
+def local_2_player_game(delay=RETURN_TO_MENU_DELAY, record_path=None, variant=None):
     """
     Runs a local 2 player game of Connect 4.
 
-    :return: None
+    :param delay: Seconds the final board stays up before returning, float.
+    :param record_path: Game record archive to append the game to, string or None to not record it.
+    :param variant: Rules of the game, Variant or None for the standard game.
+    :return: 1 if player 1 wins, 2 if player 2 wins, 3 if draw.
     """
-    # is_player_1_turn checks if it player 1 turn or not
-    is_player_1_turn = True
-    # is_board_blank checks if the board is blank
-    is_board_blank = True
+    game = Game(variant)
     # display_previous_move shows a message of the player dropping a piece in which column
     display_previous_move = ""
-    # create blank board
-    board = create_board()
 
     # checks if the game is still going or not
-    while end_of_game(board) == 0:
-        clear_screen()
-        print_board(board)
-
-        if not is_board_blank:
-            print(display_previous_move)
-
-        if is_player_1_turn:
-            move = execute_player_turn(1, board)
-            display_previous_move = "Player 1 dropped a piece into column " + str(move)
-            is_player_1_turn = False
-            is_board_blank = False
-        else:
-            move = execute_player_turn(2, board)
-            display_previous_move = "Player 2 dropped a piece into column " + str(move)
-            is_player_1_turn = True
+    while game.result() == 0:
+        render_game(game, display_previous_move)
+        player = game.player
+        move = execute_player_turn(game)
+        display_previous_move = (
+            "Player " + str(player) + " dropped a piece into column " + str(move)
+        )
 
     # print the board one final time to show the end of the game
-    print_board(board)
-    if end_of_game(board) == 1:
-        print("Player 1 won!")
-    elif end_of_game(board) == 2:
-        print("Player 2 won!")
+    if game.result() == 1:
+        message = "Player 1 won!"
+    elif game.result() == 2:
+        message = "Player 2 won!"
     else:
-        print("It is a draw!")
+        message = "It is a draw!"
+    render_game(game, message)
+    # records only hold games of the standard game
+    if record_path and game.variant is STANDARD_VARIANT:
+        record_game(record_path, game.history, game.result(), RECORD_LOCAL)
 
-    print("Game will be returning to the main lobby in 3 seconds")
-    time.sleep(3)
-    main()
+    print("Game will be returning to the main lobby in " + str(delay) + " seconds")
+    time.sleep(delay)
+    return game.result()
 
 
-def main():
+def main(delay=RETURN_TO_MENU_DELAY, record_path=None, variant=None):
     """
     Defines the main application loop.
     User chooses a type of game to play or to exit.
 
+    :param delay: Seconds the final board of a game stays up before returning to the menu, float.
+    :param record_path: Game record archive to append every game to, string or None to not record them.
+    :param variant: Rules of the games, Variant or None for the standard game.
     :return: None
     """
     clear_screen()
@@ -317,37 +1173,40 @@ def main():
         if option == 1:
             clear_screen()
             print_rules()
+            if variant is not None and variant is not STANDARD_VARIANT:
+                print(
+                    "This game is played on a {}x{} grid and needs {} in a row to win.".format(
+                        variant.num_rows, variant.num_columns, variant.connect
+                    )
+                )
         elif option == 2:
-            local_2_player_game()
+            local_2_player_game(delay, record_path, variant)
+            clear_screen()
         elif option == 3:
-            game_against_cpu()
+            game_against_cpu(delay, record_path, variant)
+            clear_screen()
         elif option == 4:
             still_playing = False
     quit()
 
 
-def cpu_player_easy(board, player):
+def cpu_player_easy(board, player, variant=None):
     """
     Executes a move for the CPU on easy difficulty. This function
-    plays a randomly selected column.
+    plays a column picked at random from the ones that are not full,
+    so it takes the same time however full the board is.
 
     :param board: The game board, 2D list of 6x7 dimensions.
     :param player: The player whose turn it is, integer value of 1 or 2.
+    :param variant: Rules of the game, Variant or None for the standard game.
     :return: Column that the piece was dropped into, int.
     """
-    random_column = random.randint(1, 7)
-    successful_drop = drop_piece(board, player, random_column)
-    if successful_drop == True:
-        return random_column
+    random_column = random.choice(legal_moves(board))
+    drop_piece(board, player, random_column)
+    return random_column
 
-    while successful_drop is False:
-        random_column = random.randint(1, 7)
-        successful_drop = drop_piece(board, player, random_column)
-        if successful_drop == True:
-            return random_column
 
-
-def cpu_player_medium(board, player):
+def cpu_player_medium(board, player, variant=None):
     """
     Executes a move for the CPU on medium difficulty.
     It first checks for an immediate win and plays that move if possible.
@@ -357,27 +1216,33 @@ def cpu_player_medium(board, player):
 
     :param board: The game board, 2D list of 6x7 dimensions.
     :param player: The player whose turn it is, integer value of 1 or 2.
+    :param variant: Rules of the game, Variant or None for the standard game.
     :return: Column that the piece was dropped into, int.
     """
-    for column in range(1, 8):
-        board_copy = [
-            [cell for cell in row] for row in board
-        ]  # makes a copy of the board to simulate the cpu dropping a piece
-        if drop_piece(board_copy, player, column):
-            if end_of_game(board_copy) == player:  # checks for an immediate win
+    connect = CONNECT_LENGTH if variant is None else variant.connect
+    for column in range(1, len(board[0]) + 1):
+        # simulates the cpu dropping a piece, then takes it back out of the board
+        row = make_move(board, player, column)
+        if row is not None:
+            is_winning_move = (
+                check_move_result(board, row, column - 1, connect=connect) == player
+            )
+            unmake_move(board, row, column)
+            if is_winning_move:  # checks for an immediate win
                 drop_piece(
                     board, player, column
                 )  # if cpu wins a piece is dropped in the actual board
                 return column
 
-    for column in range(1, 8):
-        board_copy = [
-            [cell for cell in row] for row in board
-        ]  # makes a copy of the board to simulate player 1 dropping a piece
-        if drop_piece(board_copy, 3 - player, column):
-            if (
-                end_of_game(board_copy) == 3 - player
-            ):  # checks for an immediate win to block
+    for column in range(1, len(board[0]) + 1):
+        # simulates player 1 dropping a piece, then takes it back out of the board
+        row = make_move(board, 3 - player, column)
+        if row is not None:
+            is_winning_move = (
+                check_move_result(board, row, column - 1, connect=connect) == 3 - player
+            )
+            unmake_move(board, row, column)
+            if is_winning_move:  # checks for an immediate win to block
                 drop_piece(
                     board, player, column
                 )  # if player 1 wins cpu drops a piece in the actual board
@@ -386,15 +1251,22 @@ def cpu_player_medium(board, player):
     return cpu_player_easy(board, player)
 
 
-def cpu_player_hard(board, player):
+def cpu_player_hard(board, player, stats=None, variant=None, cache=None):
     """
     Executes a move for the CPU on hard difficulty.
-    This function creates a copy of the board to simulate moves.
-    <Insert player strategy here>
+    Each step of the strategy is a function in HARD_STRATEGY, tried
+    in order until one of them plays a move. Moves are simulated on
+    the board itself with make_move and unmake_move, so the board is
+    left as it was before every check. The steps that look for lines
+    of pieces simulate their moves through a ThreatIndex of the board,
+    which keeps the pieces in every line counted as the moves are made.
 
     :param board: The game board, 2D list of 6x7 dimensions.
     :param player: The player whose turn it is, integer value of 1 or 2.
-    :return: None
+    :param stats: Collects the cost of every step of the move, HardPlayerStats or None.
+    :param variant: Rules of the game, Variant or None for the standard game.
+    :param cache: Remembers the moves of positions seen before, HardMoveCache or None. Measured moves do not use it.
+    :return: Column that the piece was dropped into, int.
 
     The strategy of hard is the following:
     1) Check if we can be bottom middle to begin game
@@ -403,348 +1275,2993 @@ def cpu_player_hard(board, player):
     4) Block any chance a player can set up a 2 win way
     5) Check if cpu can form 3 pieces in a row to set up a fourth
     6) Check if player can form 3 pieces in a row to set up a fourth to block
-    7) Check if player can form 2 pieces in a row to build a way to 4
-    8) Check if cpu can form 2 pieces in a row to build a way to 4
+    7) Check if cpu can form 2 pieces in a row to build a way to 4
+    8) Check if player can form 2 pieces in a row to build a way to 4 to block
     9) random generator for column
     """
+    if stats is not None:
+        return stats.measure_move(board, player, variant)
+
+    if cache is not None:
+        key = hard_position_key(board, player, variant)
+        column = cache.get(key)
+        if column is not None:
+            drop_piece(board, player, column)
+            return column
+
+    index = ThreatIndex(board, variant)
+    for _, strategy_step in HARD_STRATEGY:
+        column = strategy_step(board, player, index)
+        if column is not None:
+            # every step but the random one always picks the same column on the same board
+            if cache is not None and strategy_step is not hard_random:
+                cache.put(key, column)
+            return column
+
+
+def hard_position_key(board, player, variant=None):
+    """
+    Creates a number that identifies a board with the given player to
+    move, for looking up the moves of cpu_player_hard. Adding the
+    occupied cells to the pieces of player 1 gives a different number
+    for every way a column can be filled, without carrying into the next
+    column. The rules are kept alongside, since the same pieces can be
+    worth a different move on another variant.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param player: The player whose turn it is, integer value of 1 or 2.
+    :param variant: Rules of the game, Variant or None for the standard game.
+    :return: The rules and the key of the position, tuple of a Variant and an int.
+    """
+    if variant is None:
+        variant = STANDARD_VARIANT
+    player_1_mask, player_2_mask = board_to_bitmasks(board, variant.bitboard_height)
+    position = player_1_mask + (player_1_mask | player_2_mask)
+    return variant, position << 1 | (player - 1)
 
-    # to start the game, if user doesn't pick the bottom middle column first
-    if board[len(board) - 1][math.floor(len(board[1]) / 2)] == 0 and drop_piece(
-        board, player, math.floor(len(board[1]) / 2) + 1
+
+# to start the game, if user doesn't pick the bottom middle column first
+def hard_bottom_middle(board, player, index):
+    middle_column = index.variant.middle_column
+    if board[len(board) - 1][middle_column] == 0 and drop_piece(
+        board, player, middle_column + 1
     ):
-        return math.floor(len(board[1]) / 2) + 1
-
-    # checks for immediate win
-    for column in range(1, 8):
-        board_copy = [
-            [cell for cell in row] for row in board
-        ]  # makes a copy of the board to simulate the cpu dropping a piece
-        if drop_piece(board_copy, player, column):
-            if end_of_game(board_copy) == player:  # checks for an immediate win
+        return middle_column + 1
+    return None
+
+
+# checks for immediate win
+def hard_immediate_win(board, player, index):
+    stats = index.stats
+    for column in range(1, len(board[0]) + 1):
+        # simulates the cpu dropping a piece, then takes it back out of the board
+        row = make_move(board, player, column)
+        if stats is not None:
+            stats.counts["make_move"] += 1
+        if row is not None:
+            if stats is not None:
+                stats.counts["check_move_result"] += 1
+            is_winning_move = (
+                check_move_result(board, row, column - 1, connect=index.variant.connect)
+                == player
+            )
+            unmake_move(board, row, column)
+            if is_winning_move:  # checks for an immediate win
                 drop_piece(
                     board, player, column
                 )  # if cpu wins a piece is dropped in the actual board
                 return column
+    return None
 
-    # checks for immediate block against player
-    for column in range(1, 8):
-        board_copy = [
-            [cell for cell in row] for row in board
-        ]  # makes a copy of the board to simulate player 1 dropping a piece
-        if drop_piece(board_copy, 3 - player, column):
-            if (
-                end_of_game(board_copy) == 3 - player
-            ):  # checks for an immediate win to block
+
+# checks for immediate block against player
+def hard_block_immediate_win(board, player, index):
+    stats = index.stats
+    for column in range(1, len(board[0]) + 1):
+        # simulates player 1 dropping a piece, then takes it back out of the board
+        row = make_move(board, 3 - player, column)
+        if stats is not None:
+            stats.counts["make_move"] += 1
+        if row is not None:
+            if stats is not None:
+                stats.counts["check_move_result"] += 1
+            is_winning_move = (
+                check_move_result(board, row, column - 1, connect=index.variant.connect)
+                == 3 - player
+            )
+            unmake_move(board, row, column)
+            if is_winning_move:  # checks for an immediate win to block
                 drop_piece(
                     board, player, column
                 )  # if player 1 wins cpu drops a piece in the actual board
                 return column
+    return None
 
-    # blocks a 2 way win from the player
-    for column in range(1, 8):
-        board_copy = [[cell for cell in row] for row in board]
-        if drop_piece(board_copy, 3 - player, column):
-            if check_cpu_does_not_give_immediate_win(board_copy, column):
-                for row in range(len(board)):
-                    if board_copy[row][column - 1] != board[row][column - 1]:
-                        if prevent_two_way_win_from_user(board_copy, 3 - player):
-                            drop_piece(board, player, column)
-                            return column
-
-    # can the cpu forms 3 pieces in a row
-    for column in range(1, 8):
-        board_copy = [[cell for cell in row] for row in board]
-        if drop_piece(board_copy, player, column):
-            if check_cpu_does_not_give_immediate_win(board_copy, column):
-                if form_connect_three(board_copy, player):
-                    drop_piece(board, player, column)
-                    return column
-
-    # blocks a 3 pieces in a row from player
-    for column in range(1, 8):
-        board_copy = [[cell for cell in row] for row in board]
-        if drop_piece(board_copy, 3 - player, column):
-            if form_connect_three(board_copy, 3 - player):
+
+# blocks a 2 way win from the player
+def hard_block_two_way_win(board, player, index):
+    for column in range(1, len(board[0]) + 1):
+        row = index.make_move(3 - player, column)
+        if row is not None:
+            # check_cpu_does_not_give_immediate_win leaves its own piece on top of the
+            # simulated one, and the threat check below is made with both in place
+            found_move = check_cpu_does_not_give_immediate_win(
+                board, column, index
+            ) and prevent_two_way_win_from_user(board, 3 - player, index)
+            # the piece left on top only exists when the column was not filled to the top
+            if row > 0:
+                index.unmake_move(row - 1, column)
+            index.unmake_move(row, column)
+            if found_move:
                 drop_piece(board, player, column)
                 return column
+    return None
+
 
-    # blocks a 2 piece in a row from player
-    for column in range(1, 8):
-        board_copy = [[cell for cell in row] for row in board]
-        if drop_piece(board_copy, player, column):
-            if check_cpu_does_not_give_immediate_win(board_copy, column):
-                if form_connect_two(board_copy, player):
-                    drop_piece(board, player, column)
-                    return column
-
-    # forms 2 pieces in a row for cpu
-    for column in range(1, 8):
-        board_copy = [[cell for cell in row] for row in board]
-        if drop_piece(board_copy, 3 - player, column):
-            if form_connect_two(board_copy, 3 - player):
+# can the cpu forms 3 pieces in a row
+def hard_connect_three(board, player, index):
+    for column in range(1, len(board[0]) + 1):
+        row = index.make_move(player, column)
+        if row is not None:
+            found_move = check_cpu_does_not_give_immediate_win(
+                board, column, index
+            ) and form_connect_three(board, player, index)
+            if row > 0:
+                index.unmake_move(row - 1, column)
+            index.unmake_move(row, column)
+            if found_move:
                 drop_piece(board, player, column)
                 return column
+    return None
 
-    return cpu_player_easy(board, player)
 
+# blocks a 3 pieces in a row from player
+def hard_block_connect_three(board, player, index):
+    for column in range(1, len(board[0]) + 1):
+        row = index.make_move(3 - player, column)
+        if row is not None:
+            found_move = form_connect_three(board, 3 - player, index)
+            index.unmake_move(row, column)
+            if found_move:
+                drop_piece(board, player, column)
+                return column
+    return None
 
-# checks cpu does not put a piece down in a column, that gives player the automatic win
-def check_cpu_does_not_give_immediate_win(board, column):
-    if drop_piece(board, 1, column):
-        if end_of_game(board) == 1:
-            return False
-    return True
 
+# forms 2 pieces in a row for cpu
+def hard_connect_two(board, player, index):
+    for column in range(1, len(board[0]) + 1):
+        row = index.make_move(player, column)
+        if row is not None:
+            found_move = check_cpu_does_not_give_immediate_win(
+                board, column, index
+            ) and form_connect_two(board, player, index)
+            if row > 0:
+                index.unmake_move(row - 1, column)
+            index.unmake_move(row, column)
+            if found_move:
+                drop_piece(board, player, column)
+                return column
+    return None
 
-# tries to prevent the player having two ways to win the game at the same time
-def prevent_two_way_win_from_user(board, player):
-    NUM_ROWS = len(board)
-    NUM_COLUMNS = len(board[1])
-
-    # check diagonal bottom left to top right
-    for row_index in range(NUM_ROWS - 1, -1, -1):
-        for col_index in range(NUM_COLUMNS):
-            if (
-                col_index < 4
-                and col_index > 0
-                and row_index < 5
-                and board[row_index][col_index]
-                == board[row_index - 1][col_index + 1]
-                == board[row_index - 2][col_index + 2]
-                and board[row_index - 3][col_index + 3] == 0
-                and board[row_index + 1][col_index - 1] == 0
-                and board[row_index][col_index] == player
-            ):
-                return True
-
-    # check diagonal bottom right to top left
-    for row_index in range(NUM_ROWS - 1, -1, -1):
-        for col_index in range(NUM_COLUMNS - 1, -1, -1):
-            if (
-                col_index > 1
-                and col_index < 6
-                and row_index < 5
-                and board[row_index][col_index]
-                == board[row_index - 1][col_index - 1]
-                == board[row_index - 2][col_index - 2]
-                and board[row_index - 3][col_index - 3] == 0
-                and board[row_index + 1][col_index + 1] == 0
-                and board[row_index][col_index] == player
-            ):
-                return True
-
-    # check horizontal
-    for row_index in range(NUM_ROWS):
-        for col_index in range(NUM_COLUMNS):
-            if (
-                col_index + 3 < 7
-                and col_index - 1 >= 0
-                and board[row_index][col_index]
-                == board[row_index][col_index + 1]
-                == board[row_index][col_index + 2]
-                and board[row_index][col_index + 3] == 0
-                and board[row_index][col_index - 1] == 0
-                and board[row_index][col_index] == player
-            ):
-                return True
 
-    return False
+# blocks a 2 piece in a row from player
+def hard_block_connect_two(board, player, index):
+    for column in range(1, len(board[0]) + 1):
+        row = index.make_move(3 - player, column)
+        if row is not None:
+            found_move = form_connect_two(board, 3 - player, index)
+            index.unmake_move(row, column)
+            if found_move:
+                drop_piece(board, player, column)
+                return column
+    return None
 
 
-# checks if cpu/player can form 3 pieces in a row
-def form_connect_three(board, player):
-    NUM_ROWS = len(board)
-    NUM_COLUMNS = len(board[1])
-
-    # check diagonal bottom left to top right
-    for row_index in range(NUM_ROWS - 1, -1, -1):
-        for col_index in range(NUM_COLUMNS):
-            if (
-                col_index < 4
-                and board[row_index][col_index]
-                == board[row_index - 1][col_index + 1]
-                == board[row_index - 2][col_index + 2]
-                and board[row_index - 3][col_index + 3] == 0
-                and board[row_index][col_index] == player
-            ):
-                return True
-
-    # check diagonal bottom right to top left
-    for row_index in range(NUM_ROWS - 1, -1, -1):
-        for col_index in range(NUM_COLUMNS - 1, -1, -1):
-            if (
-                col_index > 1
-                and board[row_index][col_index]
-                == board[row_index - 1][col_index - 1]
-                == board[row_index - 2][col_index - 2]
-                and board[row_index - 3][col_index - 3] == 0
-                and board[row_index][col_index] == player
-            ):
-                return True
-
-    # check horizontal
-    for row_index in range(NUM_ROWS):
-        for col_index in range(NUM_COLUMNS):
-            if (
-                col_index + 3 < 7
-                and board[row_index][col_index]
-                == board[row_index][col_index + 1]
-                == board[row_index][col_index + 2]
-                and board[row_index][col_index + 3] == 0
-                and board[row_index][col_index] == player
-            ):
-                return True
-
-    # check vertical
-    for row_index in range(NUM_ROWS - 1, -1, -1):
-        for col_index in range(NUM_COLUMNS):
-            if (
-                board[row_index][col_index]
-                == board[row_index - 1][col_index]
-                == board[row_index - 2][col_index]
-                and board[row_index - 3][col_index] == 0
-                and board[row_index][col_index] == player
-            ):
-                return True
+# falls back to a random column when no other step finds a move
+def hard_random(board, player, index):
+    return cpu_player_easy(board, player)
 
-    return False
 
+# the steps of cpu_player_hard in the order they are tried, with the name they are reported by
+HARD_STRATEGY = (
+    ("bottom_middle", hard_bottom_middle),
+    ("immediate_win", hard_immediate_win),
+    ("block_immediate_win", hard_block_immediate_win),
+    ("block_two_way_win", hard_block_two_way_win),
+    ("connect_three", hard_connect_three),
+    ("block_connect_three", hard_block_connect_three),
+    ("connect_two", hard_connect_two),
+    ("block_connect_two", hard_block_connect_two),
+    ("random", hard_random),
+)
 
-# checks if cpu/player can form 2 pieces in a row
-def form_connect_two(board, player):
-    NUM_ROWS = len(board)
-    NUM_COLUMNS = len(board[1])
 
-    # check horizontal
-    for row_index in range(NUM_ROWS):
-        for col_index in range(NUM_COLUMNS):
-            if (
-                col_index + 2 < 7
-                and board[row_index][col_index] == board[row_index][col_index + 1]
-                and board[row_index][col_index + 2] == 0
-                and board[row_index][col_index] == player
-            ):
-                return True
-            elif (
-                col_index - 1 > 0
-                and col_index + 1 < 6
-                and board[row_index][col_index] == board[row_index][col_index + 1]
-                and board[row_index][col_index - 1] == 0
-                and board[row_index][col_index] == player
-            ):
-                return True
-
-    for row_index in range(NUM_ROWS - 1, -1, -1):
-        for col_index in range(NUM_COLUMNS):
-            if (
-                col_index < 5
-                and board[row_index][col_index] == board[row_index - 1][col_index + 1]
-                and board[row_index - 2][col_index + 2] == 0
-                and board[row_index][col_index] == player
-            ):
-                return True
-
-    # check diagonal bottom right to top left
-    for row_index in range(NUM_ROWS - 1, -1, -1):
-        for col_index in range(NUM_COLUMNS - 1, -1, -1):
-            if (
-                col_index > 0
-                and board[row_index][col_index] == board[row_index - 1][col_index - 1]
-                and board[row_index - 2][col_index - 2] == 0
-                and board[row_index][col_index] == player
-            ):
-                return True
-
-    # check vertical
-    for row_index in range(NUM_ROWS - 1, -1, -1):
-        for col_index in range(NUM_COLUMNS):
-            if (
-                board[row_index][col_index] == board[row_index - 1][col_index]
-                and board[row_index - 2][col_index] == 0
-                and board[row_index][col_index] == player
+class HardPlayerStats:
+    """
+    Collects where cpu_player_hard spends its time: how often each step
+    of HARD_STRATEGY decides the move, the time spent in each step, and
+    the number of win checks and simulated moves made. A move is only
+    measured when the stats object is passed to cpu_player_hard, so
+    moves without it run exactly as before.
+
+    The steps find the stats object through the ThreatIndex of the move
+    and count their own calls to check_move_result and make_move into it,
+    so measuring a move changes nothing outside of it.
+    """
+
+    def __init__(self):
+        self.moves = 0
+        self.step_hits = {name: 0 for name, _ in HARD_STRATEGY}
+        self.step_seconds = {name: 0.0 for name, _ in HARD_STRATEGY}
+        # counts holds the calls made by the steps of every measured move
+        self.counts = {"check_move_result": 0, "make_move": 0}
+
+    def measure_move(self, board, player, variant=None):
+        """
+        Plays a cpu_player_hard move while measuring every step of it.
+
+        :param board: The game board, 2D list of 6x7 dimensions.
+        :param player: The player whose turn it is, integer value of 1 or 2.
+        :param variant: Rules of the game, Variant or None for the standard game.
+        :return: Column that the piece was dropped into, int.
+        """
+        self.moves += 1
+        index = ThreatIndex(board, variant, self)
+        for name, strategy_step in HARD_STRATEGY:
+            start = time.perf_counter()
+            column = strategy_step(board, player, index)
+            self.step_seconds[name] += time.perf_counter() - start
+            if column is not None:
+                self.step_hits[name] += 1
+                return column
+
+    def report(self):
+        """
+        Describes the collected stats, with the time and calls per move.
+
+        :return: A table of the stats, string.
+        """
+        moves = max(self.moves, 1)
+        lines = [
+            "{} moves measured".format(self.moves),
+            "{:<22} {:>8} {:>12} {:>12}".format(
+                "step", "decided", "ms total", "ms/move"
+            ),
+        ]
+        for name, _ in HARD_STRATEGY:
+            seconds = self.step_seconds[name]
+            lines.append(
+                "{:<22} {:>8} {:>12.2f} {:>12.3f}".format(
+                    name, self.step_hits[name], seconds * 1000, seconds * 1000 / moves
+                )
+            )
+        for name, count in self.counts.items():
+            lines.append("{} calls per move: {:.1f}".format(name, count / moves))
+        return "\n".join(lines)
+
+
+class HardMoveCache:
+    """
+    Remembers the column cpu_player_hard played on a board, so a position
+    met again, in the same game or any later one, is answered with a
+    dictionary lookup instead of running the strategy again. Moves of the
+    random step are never stored, so a cached player makes the same moves
+    and draws the same random numbers as one without a cache.
+
+    The cache holds at most max_entries positions. Once it is full, the
+    position that was looked up or stored longest ago is evicted to make
+    room for a new one.
+    """
+
+    def __init__(self, max_entries=HARD_MOVE_CACHE_ENTRIES):
+        """
+        :param max_entries: Most positions the cache holds, int.
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Looks up the move of a position and marks it as recently used.
+
+        :param key: Key of the position from hard_position_key.
+        :return: The column played, int, or None if the position is not stored.
+        """
+        column = self.entries.get(key)
+        if column is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return column
+
+    def put(self, key, column):
+        """
+        Stores the move of a position, evicting the least recently used
+        position when the cache is full.
+
+        :param key: Key of the position from hard_position_key.
+        :param column: The column played starting at 1, int.
+        :return: None
+        """
+        self.entries[key] = column
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Removes every position from the cache, keeping its stats.
+
+        :return: None
+        """
+        self.entries.clear()
+
+    def counts(self):
+        """
+        :return: Hits, misses and evictions so far, tuple of three ints.
+        """
+        return self.hits, self.misses, self.evictions
+
+    def report(self):
+        """
+        Describes the stats of the cache.
+
+        :return: The hits, misses and evictions with the hit rate, string.
+        """
+        return describe_hard_cache_counts(self.counts()) + ", {} positions held".format(
+            len(self.entries)
+        )
+
+
+def describe_hard_cache_counts(counts):
+    """
+    :param counts: Hits, misses and evictions of a HardMoveCache, tuple of three ints.
+    :return: The counts with the hit rate, string.
+    """
+    hits, misses, evictions = counts
+    return "{} hits, {} misses ({:.1%} hit rate), {} evictions".format(
+        hits, misses, hits / max(hits + misses, 1), evictions
+    )
+
+
+# move cache shared by the hard moves of tournaments in this process, see get_hard_move_cache
+hard_move_cache = None
+
+
+def get_hard_move_cache(max_entries=HARD_MOVE_CACHE_ENTRIES):
+    """
+    Returns the move cache shared by the hard moves of tournaments in
+    this process, creating it on first use or when a different size is
+    asked for.
+
+    :param max_entries: Most positions the cache holds, int.
+    :return: The shared cache, HardMoveCache.
+    """
+    global hard_move_cache
+    if hard_move_cache is None or hard_move_cache.max_entries != max_entries:
+        hard_move_cache = HardMoveCache(max_entries)
+    return hard_move_cache
+
+
+def profile_cpu_game(player_1_cpu, player_2_cpu, path):
+    """
+    Plays a headless game between two CPU players under cProfile and
+    saves the profile, which can be read with the pstats module.
+
+    :param player_1_cpu: CPU player function that moves first.
+    :param player_2_cpu: CPU player function that moves second.
+    :param path: Path of the file to save the profile to, string.
+    :return: 1 if player 1 wins, 2 if player 2 wins, 3 if draw.
+    """
+    profiler = cProfile.Profile()
+    game_result = profiler.runcall(play_cpu_game, player_1_cpu, player_2_cpu)
+    profiler.dump_stats(path)
+    return game_result
+
+
+# checks cpu does not put a piece down in a column, that gives player the automatic win.
+# the piece dropped for player 1 is left on the board, the caller takes it back out
+# with unmake_move on the row above its own simulated piece. When a ThreatIndex of the
+# board is given, the piece is dropped through it so its line counts stay up to date
+def check_cpu_does_not_give_immediate_win(board, column, index=None):
+    connect = CONNECT_LENGTH
+    if index is not None:
+        row = index.make_move(1, column)
+        connect = index.variant.connect
+    else:
+        row = make_move(board, 1, column)
+    if row is not None:
+        if index is not None and index.stats is not None:
+            index.stats.counts["check_move_result"] += 1
+        if check_move_result(board, row, column - 1, connect=connect) == 1:
+            return False
+    return True
+
+
+def winning_lines(num_rows, num_columns, length=4):
+    """
+    Lists every line of cells a player can connect to win, in rows,
+    columns and both diagonals.
+
+    :param num_rows: Number of rows of the board, int.
+    :param num_columns: Number of columns of the board, int.
+    :param length: Number of pieces in a row that wins, int.
+    :return: The (row, col) cells of every line, list of tuples.
+    """
+    lines = []
+    for row in range(num_rows):
+        for col in range(num_columns):
+            for row_step, col_step in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                last_row = row + row_step * (length - 1)
+                last_col = col + col_step * (length - 1)
+                if 0 <= last_row < num_rows and 0 <= last_col < num_columns:
+                    lines.append(
+                        tuple(
+                            (row + row_step * step, col + col_step * step)
+                            for step in range(length)
+                        )
+                    )
+    return lines
+
+
+class Variant:
+    """
+    The rules of a game of Connect 4: the number of rows and columns of
+    the board and the number of pieces in a row that wins, together with
+    the tables the module looks lines up in for those rules. Variants are
+    created once for each set of rules by get_variant, so the tables are
+    only ever built once.
+
+    The standard game keeps its own constants and functions, such as
+    WINNING_LINES and has_four_in_a_row, and functions given no variant
+    use those directly.
+    """
+
+    __slots__ = (
+        "num_rows",
+        "num_columns",
+        "connect",
+        "bitboard_height",
+        "middle_column",
+        "winning_lines",
+        "cell_lines",
+        "line_counts",
+        "has_connection",
+    )
+
+    def __init__(self, num_rows, num_columns, connect):
+        """
+        :param num_rows: Number of rows of the board, int.
+        :param num_columns: Number of columns of the board, int.
+        :param connect: Number of pieces in a row that wins, int.
+        :raises ValueError: If no line of connect pieces fits on the board.
+        """
+        if num_rows < 1 or num_columns < 1 or connect < 3:
+            raise ValueError(
+                "A board needs a row and a column, and a line of 3 or more"
+            )
+        if connect > max(num_rows, num_columns):
+            raise ValueError("A line of " + str(connect) + " does not fit on the board")
+        self.num_rows = num_rows
+        self.num_columns = num_columns
+        self.connect = connect
+        # bits per column of the bitboard layout, sentinel included, see Bitboard
+        self.bitboard_height = num_rows + 1
+        # column index the centre pieces of evaluate are counted in
+        self.middle_column = num_columns // 2
+        # the lines of cells a player can connect to win, and the index of
+        # every line through each cell
+        self.winning_lines = winning_lines(num_rows, num_columns, connect)
+        self.cell_lines = [[() for _ in range(num_columns)] for _ in range(num_rows)]
+        for index, line in enumerate(self.winning_lines):
+            for row, col in line:
+                self.cell_lines[row][col] += (index,)
+        # what ThreatIndex looks up on every piece, in one tuple so it is read at
+        # once: the lines through each cell, the middle column, the number of rows
+        # and the number of pieces one less than a two, in a two and in a three
+        self.line_counts = (
+            self.cell_lines,
+            self.middle_column,
+            num_rows,
+            connect - 3,
+            connect - 2,
+            connect - 1,
+        )
+        # checks a bitmask of one player's pieces for a line that wins
+        if (num_rows, num_columns, connect) == (NUM_ROWS, NUM_COLUMNS, CONNECT_LENGTH):
+            self.has_connection = has_four_in_a_row
+        else:
+            self.has_connection = partial(
+                has_n_in_a_row, height=self.bitboard_height, connect=connect
+            )
+
+    def __reduce__(self):
+        # worker processes look the variant up again instead of copying its tables
+        return get_variant, (self.num_rows, self.num_columns, self.connect)
+
+    def __repr__(self):
+        return "Variant({}, {}, {})".format(
+            self.num_rows, self.num_columns, self.connect
+        )
+
+
+# every variant created so far, by number of rows, columns and pieces in a row
+variants = {}
+
+
+def get_variant(num_rows=NUM_ROWS, num_columns=NUM_COLUMNS, connect=CONNECT_LENGTH):
+    """
+    Returns the rules of a game of Connect 4, creating their tables on
+    first use.
+
+    :param num_rows: Number of rows of the board, int.
+    :param num_columns: Number of columns of the board, int.
+    :param connect: Number of pieces in a row that wins, int.
+    :return: The rules, Variant.
+    :raises ValueError: If no line of connect pieces fits on the board.
+    """
+    rules = (num_rows, num_columns, connect)
+    if rules not in variants:
+        variants[rules] = Variant(num_rows, num_columns, connect)
+    return variants[rules]
+
+
+# the standard game of four in a row on 6 rows and 7 columns
+STANDARD_VARIANT = get_variant()
+# the 69 lines of four cells on the board, and the index of every line through each cell
+WINNING_LINES = STANDARD_VARIANT.winning_lines
+CELL_LINES = STANDARD_VARIANT.cell_lines
+
+
+class ThreatIndex:
+    """
+    Counts the pieces of each player in every winning line of its
+    variant on a board. Threats are then looked up instead of found by
+    scanning the board. Moves made through the index update only the
+    lines through the cell that was played, at most 13 of them.
+
+    A line is open for a player while the opponent has no piece in it.
+    An open line with three of the player's pieces is a threat, and its
+    empty cell wins the game when the player drops a piece there. On a
+    variant with longer lines, the threes and twos are the open lines
+    one and two pieces short of a win.
+
+    The counts that evaluate scores a position by are kept up to date
+    the same way, so scoring a position does not look at the board.
+    """
+
+    __slots__ = (
+        "variant",
+        "board",
+        "counts",
+        "threes",
+        "twos",
+        "centers",
+        "good_threats",
+        "stats",
+    )
+
+    def __init__(self, board, variant=None, stats=None):
+        """
+        :param board: The game board the index follows, 2D list of 6x7 dimensions.
+        :param variant: Rules of the game on the board, Variant or None for the standard game.
+        :param stats: Counts the moves made through the index, HardPlayerStats or None.
+        """
+        if variant is None:
+            variant = STANDARD_VARIANT
+        self.variant = variant
+        self.stats = stats
+        lines = len(variant.winning_lines)
+        # counts[player][line] is the number of the player's pieces in the line
+        self.counts = [None, [0] * lines, [0] * lines]
+        # threes[player] holds the open lines with three of the player's pieces,
+        # twos[player] is the number of open lines with two of the player's pieces
+        self.threes = [None, set(), set()]
+        self.twos = [None, 0, 0]
+        # centers[player] is the number of the player's pieces in the middle column
+        self.centers = [None, 0, 0]
+        # good_threats[player] is the number of the player's threats whose empty cell
+        # is on a row of the parity that favours them, see threat_parity
+        self.good_threats = [None, 0, 0]
+        # the pieces are counted onto an empty copy one at a time, so every line
+        # only ever holds the pieces counted so far
+        self.board = create_board(variant.num_rows, variant.num_columns)
+        for row_index in range(variant.num_rows):
+            for col_index in range(variant.num_columns):
+                if board[row_index][col_index] != 0:
+                    self.add(row_index, col_index, board[row_index][col_index])
+        self.board = board
+
+    def add(self, row, col, player):
+        """
+        Places a piece in the board of the index and counts it in every
+        line through its cell.
+
+        :param row: Row of the piece, starting at 0 from the top, int.
+        :param col: Column of the piece, starting at 0, int.
+        :param player: The player the piece belongs to, integer value of 1 or 2.
+        :return: None
+        """
+        cell_lines, middle_column, num_rows, one, two, three = self.variant.line_counts
+        self.board[row][col] = player
+        if col == middle_column:
+            self.centers[player] += 1
+        opponent = 3 - player
+        counts = self.counts[player]
+        other_counts = self.counts[opponent]
+        twos = self.twos
+        for line in cell_lines[row][col]:
+            count = counts[line]
+            counts[line] = count + 1
+            if other_counts[line] == 0:
+                # the line stays open for the player, with one more piece in it
+                if count == one:
+                    twos[player] += 1
+                elif count == two:
+                    twos[player] -= 1
+                    self.threes[player].add(line)
+                    self.good_threats[player] += threat_parity(
+                        self.empty_cell(line), player, num_rows
+                    )
+                elif count == three:
+                    self.threes[player].discard(line)
+                    self.good_threats[player] -= threat_parity(row, player, num_rows)
+            elif count == 0:
+                # the line was open for the opponent, and is blocked by this piece
+                other_count = other_counts[line]
+                if other_count == two:
+                    twos[opponent] -= 1
+                elif other_count == three:
+                    self.threes[opponent].discard(line)
+                    self.good_threats[opponent] -= threat_parity(
+                        row, opponent, num_rows
+                    )
+
+    def remove(self, row, col, player):
+        """
+        Takes a piece off the board of the index and out of the counts of
+        every line through its cell, undoing add.
+
+        :param row: Row of the piece, starting at 0 from the top, int.
+        :param col: Column of the piece, starting at 0, int.
+        :param player: The player the piece belongs to, integer value of 1 or 2.
+        :return: None
+        """
+        cell_lines, middle_column, num_rows, one, two, three = self.variant.line_counts
+        self.board[row][col] = 0
+        if col == middle_column:
+            self.centers[player] -= 1
+        opponent = 3 - player
+        counts = self.counts[player]
+        other_counts = self.counts[opponent]
+        twos = self.twos
+        for line in cell_lines[row][col]:
+            count = counts[line] - 1
+            counts[line] = count
+            if other_counts[line] == 0:
+                if count == one:
+                    twos[player] -= 1
+                elif count == two:
+                    # the other empty cell of the line was the one its threat was on
+                    twos[player] += 1
+                    self.threes[player].discard(line)
+                    self.good_threats[player] -= threat_parity(
+                        self.empty_cell(line, (row, col)), player, num_rows
+                    )
+                elif count == three:
+                    self.threes[player].add(line)
+                    self.good_threats[player] += threat_parity(row, player, num_rows)
+            elif count == 0:
+                # the line is open for the opponent again
+                other_count = other_counts[line]
+                if other_count == two:
+                    twos[opponent] += 1
+                elif other_count == three:
+                    self.threes[opponent].add(line)
+                    self.good_threats[opponent] += threat_parity(
+                        row, opponent, num_rows
+                    )
+
+    def empty_cell(self, line, skip=None):
+        """
+        :param line: Index of a line in the winning lines of the variant, int.
+        :param skip: A (row, col) cell to pass over, tuple or None.
+        :return: Row of the first empty cell of the line, int.
+        """
+        for row, col in self.variant.winning_lines[line]:
+            if self.board[row][col] == 0 and (row, col) != skip:
+                return row
+
+    def make_move(self, player, column):
+        """
+        Drops a piece on the board with make_move and counts it.
+
+        :param player: The player whose piece is dropped, integer value of 1 or 2.
+        :param column: The column to drop the piece into, starting at 1, int.
+        :return: Row the piece landed in, or None if the column is full.
+        """
+        row = make_move(self.board, player, column)
+        if self.stats is not None:
+            self.stats.counts["make_move"] += 1
+        if row is not None:
+            self.add(row, column - 1, player)
+        return row
+
+    def unmake_move(self, row, column):
+        """
+        Takes a piece back off the board with unmake_move and out of the counts.
+
+        :param row: Row the piece landed in, int.
+        :param column: The column of the piece, starting at 1, int.
+        :return: None
+        """
+        self.remove(row, column - 1, self.board[row][column - 1])
+        unmake_move(self.board, row, column)
+
+    def threat_cells(self, player):
+        """
+        :param player: The player to find threats of, integer value of 1 or 2.
+        :return: The empty (row, col) cells that would connect four for the player, set.
+        """
+        cells = set()
+        lines = self.variant.winning_lines
+        for line in self.threes[player]:
+            for row, col in lines[line]:
+                if self.board[row][col] == 0:
+                    cells.add((row, col))
+        return cells
+
+    def score(self, player):
+        """
+        Weighs the counts of both players into a heuristic score.
+
+        :param player: The player to score the position for, integer value of 1 or 2.
+        :return: The player's weighted counts minus the opponent's, int.
+        """
+        scores = [
+            OPEN_TWO_SCORE * self.twos[side]
+            + OPEN_THREE_SCORE * len(self.threes[side])
+            + CENTER_SCORE * self.centers[side]
+            + THREAT_PARITY_SCORE * self.good_threats[side]
+            for side in (1, 2)
+        ]
+        return scores[player - 1] - scores[2 - player]
+
+
+def threat_parity(row, player, num_rows=NUM_ROWS):
+    """
+    Checks if a threat on the given row favours the player. Near the end
+    of a game the columns fill up in turns, so the first player tends to
+    be the one to reach the odd rows counted from the bottom, and the
+    second player the even ones.
+
+    :param row: Row of the empty cell of a threat, starting at 0 from the top, int.
+    :param player: The player with the threat, integer value of 1 or 2.
+    :param num_rows: Number of rows of the board, int.
+    :return: 1 if the row favours the player, else 0, int.
+    """
+    return 1 if (num_rows - row) % 2 == player % 2 else 0
+
+
+def evaluate(board, player, index=None):
+    """
+    Scores a position for the player with a heuristic: open twos and
+    threes, pieces in the middle column and threats on rows of the
+    right parity each add to the player's score and take away from the
+    opponent's. The score is 0 for an even position and much smaller
+    than the score of a win in search.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param player: The player to score the position for, integer value of 1 or 2.
+    :param index: Counts of the board kept up to date as moves are made, ThreatIndex or None to count them.
+    :return: Heuristic score, int.
+    """
+    if index is None:
+        index = ThreatIndex(board)
+    return index.score(player)
+
+
+# checks if the player has two ways to win the game at the same time, two different
+# empty cells that each connect four for them
+def prevent_two_way_win_from_user(board, player, index=None):
+    if index is None:
+        index = ThreatIndex(board)
+    return len(index.threat_cells(player)) >= 2
+
+
+# checks if cpu/player has 3 pieces in a line of four whose last cell is empty
+def form_connect_three(board, player, index=None):
+    if index is None:
+        index = ThreatIndex(board)
+    return len(index.threes[player]) > 0
+
+
+# checks if cpu/player has 2 pieces in a line of four whose other cells are empty
+def form_connect_two(board, player, index=None):
+    if index is None:
+        index = ThreatIndex(board)
+    return index.twos[player] > 0
+
+
+# outcome of a search: the best column and its score, how many moves ahead were fully
+# searched, the number of positions visited, the seconds taken and positions per second
+SearchResult = namedtuple(
+    "SearchResult", ["column", "score", "depth", "nodes", "elapsed", "nodes_per_second"]
+)
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when its time budget runs out.
+    """
+
+
+class TranspositionTable:
+    """
+    Fixed size store of search results keyed by Bitboard.key, so a
+    position reached again, either later in the same search through a
+    different move order or in a later move or game, is not searched
+    twice.
+
+    A position and its mirror image share one entry through
+    canonical_key, with the best column translated on the way in and out.
+
+    All memory is allocated up front in two flat arrays, which keeps the
+    size of the table the same however many games it is used for. The
+    table is split into buckets of two slots. The first slot keeps the
+    entry that was searched deepest and is only replaced by an entry
+    searched at least as deep. The second slot is always replaced by the
+    newest entry that did not go into the first one.
+    """
+
+    # number of bytes each slot takes up, one 64-bit key and one 64-bit value
+    SLOT_BYTES = 16
+
+    def __init__(self, size_mb=TRANSPOSITION_TABLE_MB):
+        """
+        :param size_mb: Memory the table may take up in megabytes, int or float.
+        """
+        self.buckets = max(1, int(size_mb * 1024 * 1024) // (2 * self.SLOT_BYTES))
+        # slot 2 * bucket is depth-preferred and slot 2 * bucket + 1 is always-replace.
+        # a key of 0 marks an empty slot, which Bitboard.key never returns
+        self.keys = array("Q", bytes(2 * self.buckets * 8))
+        self.values = array("q", bytes(2 * self.buckets * 8))
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def clear(self):
+        """
+        Removes every entry from the table.
+
+        :return: None
+        """
+        self.keys = array("Q", bytes(2 * self.buckets * 8))
+        self.values = array("q", bytes(2 * self.buckets * 8))
+
+    def probe(self, key):
+        """
+        Looks up a position in the table.
+
+        :param key: Key of the position from Bitboard.key, int.
+        :return: Depth, kind of score, score and best column of the entry, tuple of four ints, or None if the position is not stored.
+        """
+        self.probes += 1
+        key, mirrored = canonical_key(key)
+        slot = 2 * (key % self.buckets)
+        if self.keys[slot] != key:
+            slot += 1
+            if self.keys[slot] != key:
+                return None
+        self.hits += 1
+        # values hold the score, depth, kind of score and best column from high bits to low
+        value = self.values[slot]
+        column = value & 15
+        if mirrored:
+            column = mirror_column(column)
+        return (value >> 6) & 63, (value >> 4) & 3, value >> 12, column
+
+    def store(self, key, depth, flag, score, column):
+        """
+        Stores the result of searching a position.
+
+        :param key: Key of the position from Bitboard.key, int.
+        :param depth: Number of moves the position was searched ahead, int.
+        :param flag: EXACT_SCORE, LOWER_BOUND or UPPER_BOUND, int.
+        :param score: Score of the position for the player to move, int.
+        :param column: Best column found starting at 1, or 0 if there is none, int.
+        :return: None
+        """
+        self.stores += 1
+        key, mirrored = canonical_key(key)
+        if mirrored:
+            column = mirror_column(column)
+        slot = 2 * (key % self.buckets)
+        if self.keys[slot] != key and (self.values[slot] >> 6) & 63 > depth:
+            slot += 1
+        self.keys[slot] = key
+        self.values[slot] = (score << 12) | (depth << 6) | (flag << 4) | column
+
+
+# transposition table shared by every expert move, created the first time it is needed
+expert_transposition_table = None
+
+
+def get_expert_transposition_table():
+    """
+    Returns the transposition table shared by every expert move,
+    creating it on first use.
+
+    :return: The shared table, TranspositionTable.
+    """
+    global expert_transposition_table
+    if expert_transposition_table is None:
+        expert_transposition_table = TranspositionTable()
+    return expert_transposition_table
+
+
+class NegamaxSearch:
+    """
+    Negamax search with alpha-beta pruning over a Bitboard. Scores are
+    always from the point of view of the player to move: a win scores
+    WIN_SCORE minus the number of pieces on the board when it happens, a
+    loss the negative of that, and unfinished positions at the depth limit
+    get a small heuristic score. Since a score only depends on the
+    position and not on how it was reached, results are shared through a
+    TranspositionTable.
+    """
+
+    def __init__(self, deadline=None, table=None):
+        """
+        :param deadline: time.perf_counter() value after which the search stops, float or None.
+        :param table: Table to reuse results from, TranspositionTable or None for no table.
+        """
+        self.deadline = deadline
+        self.table = table
+        self.nodes = 0
+
+    def evaluate(self, bitboard, player):
+        """
+        Scores a position at the depth limit with evaluate, from the
+        ThreatIndex the bitboard keeps up to date on every move.
+
+        :param bitboard: The position to score, Bitboard.
+        :param player: The player to move, int.
+        :return: Heuristic score for the player, int.
+        """
+        return bitboard.track_threats().score(player)
+
+    def ordered_moves(self, bitboard, first_column):
+        """
+        Lists the legal columns, starting with first_column and then
+        from the middle column outwards.
+
+        :param bitboard: The position to move in, Bitboard.
+        :param first_column: Column to try first, or 0 for none, int.
+        :return: Legal columns starting at 1, list of ints.
+        """
+        columns = [
+            column
+            for column in CENTER_FIRST_ORDER
+            if column != first_column and bitboard.can_drop(column)
+        ]
+        if first_column and bitboard.can_drop(first_column):
+            columns.insert(0, first_column)
+        return columns
+
+    def negamax(self, bitboard, player, depth, alpha, beta):
+        """
+        Scores a position by searching depth moves ahead.
+
+        :param bitboard: The position to search, Bitboard.
+        :param player: The player to move, int.
+        :param depth: Number of moves left to search, int.
+        :param alpha: Score the player is already guaranteed, int.
+        :param beta: Score the opponent is already guaranteed, int.
+        :return: Score of the position for the player, int.
+        """
+        self.nodes += 1
+        if (
+            self.deadline is not None
+            and self.nodes & 255 == 0
+            and time.perf_counter() > self.deadline
+        ):
+            raise SearchTimeout()
+
+        move_count = bitboard.moves
+        # a position where the player can connect four right away needs no search
+        for column in CENTER_FIRST_ORDER:
+            if bitboard.is_winning_drop(player, column):
+                return WIN_SCORE - move_count - 1
+        if move_count == NUM_ROWS * NUM_COLUMNS:
+            return 0
+        if depth == 0:
+            return self.evaluate(bitboard, player)
+
+        table = self.table
+        table_column = 0
+        if table is not None:
+            key = bitboard.key(player)
+            entry = table.probe(key)
+            if entry is not None:
+                entry_depth, flag, score, table_column = entry
+                if entry_depth >= depth:
+                    if flag == EXACT_SCORE:
+                        return score
+                    if flag == LOWER_BOUND and score > alpha:
+                        alpha = score
+                    elif flag == UPPER_BOUND and score < beta:
+                        beta = score
+                    if alpha >= beta:
+                        return score
+
+        original_alpha = alpha
+        best_score = -WIN_SCORE - 1
+        best_column = 0
+        for column in self.ordered_moves(bitboard, table_column):
+            bitboard.drop(player, column)
+            try:
+                score = -self.negamax(bitboard, 3 - player, depth - 1, -beta, -alpha)
+            finally:
+                bitboard.undo()
+            if score > best_score:
+                best_score = score
+                best_column = column
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if table is not None:
+            if best_score <= original_alpha:
+                flag = UPPER_BOUND
+            elif best_score >= beta:
+                flag = LOWER_BOUND
+            else:
+                flag = EXACT_SCORE
+            table.store(key, depth, flag, best_score, best_column)
+        return best_score
+
+    def best_move(self, bitboard, player, depth, first_column=0):
+        """
+        Searches every legal column and finds the best one. If the
+        time budget runs out, the best column among the ones fully
+        searched so far is returned.
+
+        :param bitboard: The position to search, Bitboard.
+        :param player: The player to move, int.
+        :param depth: Number of moves to search ahead, int.
+        :param first_column: Column to search first, or 0 to use the transposition table's best column, int.
+        :return: Best column starting at 1, its score and whether every column was searched, tuple of int, int and bool.
+        """
+        if not first_column and self.table is not None:
+            entry = self.table.probe(bitboard.key(player))
+            if entry is not None:
+                first_column = entry[3]
+
+        best_column = None
+        best_score = -WIN_SCORE - 1
+        for column in self.ordered_moves(bitboard, first_column):
+            if best_column is None:
+                # keeps a legal move to fall back on if the time budget runs out
+                best_column = column
+            if bitboard.is_winning_drop(player, column):
+                return column, WIN_SCORE - bitboard.moves - 1, True
+            bitboard.drop(player, column)
+            try:
+                score = -self.negamax(
+                    bitboard, 3 - player, depth - 1, -WIN_SCORE - 1, -best_score
+                )
+            except SearchTimeout:
+                return best_column, best_score, False
+            finally:
+                bitboard.undo()
+            if score > best_score:
+                best_column = column
+                best_score = score
+
+        if self.table is not None:
+            self.table.store(
+                bitboard.key(player), depth, EXACT_SCORE, best_score, best_column
+            )
+        return best_column, best_score, True
+
+    def iterative_deepening(self, bitboard, player, max_depth):
+        """
+        Searches one move ahead, then two, and so on until max_depth is
+        reached, the game's outcome is found or the time budget runs out.
+        Every iteration starts from the best column of the one before it,
+        and the transposition table carries the best columns found deeper
+        in the tree over too, so most of the pruning of a deeper iteration
+        comes from the shallower ones. A best column is known from the
+        first iteration on, so the search can be stopped at any time.
+
+        :param bitboard: The position to search, Bitboard.
+        :param player: The player to move, int.
+        :param max_depth: Deepest number of moves to search ahead, int.
+        :return: The outcome of the search, SearchResult.
+        """
+        start = time.perf_counter()
+        # the remaining empty cells bound how deep the game can go
+        max_depth = min(max_depth, NUM_ROWS * NUM_COLUMNS - bitboard.moves)
+        best_column = 0
+        best_score = 0
+        depth_reached = 0
+        for depth in range(1, max_depth + 1):
+            column, score, completed = self.best_move(
+                bitboard, player, depth, best_column
+            )
+            # a cut short iteration searched the previous best column first,
+            # so its best column is at least as well informed
+            if column is not None:
+                best_column = column
+            if not completed:
+                break
+            best_score = score
+            depth_reached = depth
+            if abs(score) > WIN_SCORE - NUM_ROWS * NUM_COLUMNS - 1:
+                # a forced win or loss was found, deeper searches cannot change it
+                break
+
+        elapsed = time.perf_counter() - start
+        return SearchResult(
+            best_column,
+            best_score,
+            depth_reached,
+            self.nodes,
+            elapsed,
+            self.nodes / elapsed if elapsed > 0 else 0.0,
+        )
+
+
+def search_position(board, player, depth=None, time_limit=None, table=None):
+    """
+    Finds the best move on a board with an iterative deepening negamax
+    search, without changing the board. When neither a depth nor a time
+    limit is given, EXPERT_TIME_LIMIT is used and the search goes as deep
+    as it can in that time. Positions in the opening book are answered
+    from it without searching, and positions searched in earlier moves
+    and games are reused through a transposition table.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param player: The player whose turn it is, integer value of 1 or 2.
+    :param depth: Deepest number of moves to search ahead, int.
+    :param time_limit: Seconds the search may take, float.
+    :param table: Table to reuse results from, TranspositionTable, defaults to the shared expert table.
+    :return: The best column with the depth reached, nodes searched and nodes per second, SearchResult.
+    """
+    start = time.perf_counter()
+    bitboard = Bitboard.from_board(board)
+
+    # early positions are looked up in the opening book instead of searched
+    book = get_opening_book()
+    if book is not None and bitboard.moves <= book.plies:
+        entry = book.lookup(bitboard.key(player))
+        if entry is not None:
+            column, book_depth, score = entry
+            return SearchResult(
+                column, score, book_depth, 0, time.perf_counter() - start, 0.0
+            )
+
+    if table is None:
+        table = get_expert_transposition_table()
+    if depth is None:
+        depth = NUM_ROWS * NUM_COLUMNS
+        if time_limit is None:
+            time_limit = EXPERT_TIME_LIMIT
+    deadline = None
+    if time_limit is not None:
+        deadline = start + time_limit
+
+    return NegamaxSearch(deadline, table).iterative_deepening(bitboard, player, depth)
+
+
+def cpu_player_expert(board, player, depth=None, time_limit=None, table=None):
+    """
+    Executes a move for the CPU on expert difficulty.
+    It searches the moves of both players ahead with negamax and
+    alpha-beta pruning, deepening the search one move at a time until
+    the depth or time limit is reached, and plays the column with the
+    best score. See search_position for the defaults.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param player: The player whose turn it is, integer value of 1 or 2.
+    :param depth: Deepest number of moves to search ahead, int.
+    :param time_limit: Seconds the search may take, float.
+    :param table: Table to reuse results from, TranspositionTable, defaults to the shared expert table.
+    :return: Column that the piece was dropped into, int.
+    """
+    column = search_position(board, player, depth, time_limit, table).column
+    drop_piece(board, player, column)
+    return column
+
+
+def winning_cells(pieces, occupied):
+    """
+    Finds the empty cells that would connect four for a player, in the
+    bit layout of Bitboard. Cells that cannot be played yet are included.
+
+    :param pieces: Bitmask of the player's pieces, int.
+    :param occupied: Bitmask of every piece on the board, int.
+    :return: Bitmask of the winning cells, int.
+    """
+    # vertical, only a cell on top of three pieces can finish a column
+    cells = (pieces << 1) & (pieces << 2) & (pieces << 3)
+    # horizontal and both diagonals, with the empty cell at any of the four places
+    for shift in (BITBOARD_HEIGHT, BITBOARD_HEIGHT - 1, BITBOARD_HEIGHT + 1):
+        pairs = (pieces << shift) & (pieces << 2 * shift)
+        cells |= pairs & (pieces << 3 * shift)
+        cells |= pairs & (pieces >> shift)
+        pairs = (pieces >> shift) & (pieces >> 2 * shift)
+        cells |= pairs & (pieces << shift)
+        cells |= pairs & (pieces >> 3 * shift)
+    return cells & (BITBOARD_FULL ^ occupied)
+
+
+class Solver:
+    """
+    Finds the exact value of a position with perfect play from both
+    players, by a negamax search that goes all the way to the end of
+    the game. The score range is narrowed with null-window searches,
+    each of which only answers whether the score is above a value, and
+    columns are tried in order of how many winning cells they create.
+
+    A score is 0 for a draw and positive when the player to move wins:
+    22 minus the number of pieces the winner has played at the end, so
+    faster wins score higher. Losses are the negative of that. Positions
+    are the two bitmasks of Bitboard, the pieces of the player to move
+    and every piece on the board.
+    """
+
+    def __init__(self, table=None):
+        """
+        :param table: Table to reuse bounds from, TranspositionTable or None for a new one.
+        """
+        self.table = table if table is not None else TranspositionTable()
+        self.nodes = 0
+
+    def negamax(self, pieces, occupied, moves, alpha, beta):
+        """
+        Scores a position where the player to move cannot win at once.
+
+        :param pieces: Bitmask of the pieces of the player to move, int.
+        :param occupied: Bitmask of every piece on the board, int.
+        :param moves: Number of pieces on the board, int.
+        :param alpha: Score the player is already guaranteed, int.
+        :param beta: Score the opponent is already guaranteed, int.
+        :return: The exact score if it is between alpha and beta, else a bound on the same side, int.
+        """
+        self.nodes += 1
+        playable = (occupied + BITBOARD_BOTTOM) & BITBOARD_FULL
+        opponent_wins = winning_cells(pieces ^ occupied, occupied)
+        forced = playable & opponent_wins
+        if forced:
+            if forced & (forced - 1):
+                # the opponent has two winning cells to play, only one can be blocked
+                return -((NUM_CELLS - moves) // 2)
+            playable = forced
+        # never play right under a cell that wins for the opponent
+        playable &= ~(opponent_wins >> 1)
+        if not playable:
+            return -((NUM_CELLS - moves) // 2)
+        if moves >= NUM_CELLS - 2:
+            return 0
+
+        # the player cannot lose sooner than two moves from now, nor win sooner
+        # than on their next move, and earlier searches may have narrowed that down
+        lowest = -((NUM_CELLS - 2 - moves) // 2)
+        highest = (NUM_CELLS - 1 - moves) // 2
+        key = pieces + occupied + BITBOARD_BOTTOM
+        entry = self.table.probe(key)
+        if entry is not None:
+            _, flag, score, _ = entry
+            if flag == UPPER_BOUND and score < highest:
+                highest = score
+            elif flag == LOWER_BOUND and score > lowest:
+                lowest = score
+        if alpha < lowest:
+            alpha = lowest
+            if alpha >= beta:
+                return alpha
+        if beta > highest:
+            beta = highest
+            if alpha >= beta:
+                return beta
+
+        # the columns that leave the player the most winning cells are tried first,
+        # from the middle column outwards between columns with as many
+        ordered = []
+        for column in CENTER_FIRST_ORDER:
+            move = playable & BITBOARD_COLUMNS[column - 1]
+            if move:
+                threats = bin(winning_cells(pieces | move, occupied)).count("1")
+                ordered.append((-threats, len(ordered), move))
+        ordered.sort()
+
+        depth = NUM_CELLS - moves
+        opponent = pieces ^ occupied
+        for _, _, move in ordered:
+            score = -self.negamax(opponent, occupied | move, moves + 1, -beta, -alpha)
+            if score >= beta:
+                self.table.store(key, depth, LOWER_BOUND, score, 0)
+                return score
+            if score > alpha:
+                alpha = score
+        self.table.store(key, depth, UPPER_BOUND, alpha, 0)
+        return alpha
+
+    def score(self, pieces, occupied, moves):
+        """
+        Finds the exact score of a position by narrowing the range it can
+        be in with null-window searches. Each test is made halfway through
+        the range, or at half the best win or loss left in it, which is
+        often cheaper to prove.
+
+        :param pieces: Bitmask of the pieces of the player to move, int.
+        :param occupied: Bitmask of every piece on the board, int.
+        :param moves: Number of pieces on the board, int.
+        :return: The score of the position for the player to move, int.
+        """
+        if winning_cells(pieces, occupied) & (occupied + BITBOARD_BOTTOM):
+            return (NUM_CELLS + 1 - moves) // 2
+        low = -((NUM_CELLS - moves) // 2)
+        high = (NUM_CELLS + 1 - moves) // 2
+        while low < high:
+            middle = low + (high - low) // 2
+            if middle <= 0 and int(low / 2) < middle:
+                middle = int(low / 2)
+            elif middle >= 0 and int(high / 2) > middle:
+                middle = int(high / 2)
+            result = self.negamax(pieces, occupied, moves, middle, middle + 1)
+            if result <= middle:
+                high = result
+            else:
+                low = result
+        return low
+
+    def best_move(self, pieces, occupied, moves):
+        """
+        Finds the score of a position and a column that keeps it.
+
+        :param pieces: Bitmask of the pieces of the player to move, int.
+        :param occupied: Bitmask of every piece on the board, int.
+        :param moves: Number of pieces on the board, int.
+        :return: The score for the player to move and the best column starting at 1, tuple of two ints.
+        """
+        score = self.score(pieces, occupied, moves)
+        playable = (occupied + BITBOARD_BOTTOM) & BITBOARD_FULL
+        winning = winning_cells(pieces, occupied) & playable
+        opponent = pieces ^ occupied
+        for column in CENTER_FIRST_ORDER:
+            move = playable & BITBOARD_COLUMNS[column - 1]
+            if not move:
+                continue
+            if move & winning:
+                return score, column
+            child_occupied = occupied | move
+            if winning_cells(opponent, child_occupied) & (
+                child_occupied + BITBOARD_BOTTOM
             ):
-                return True
+                child_score = (NUM_CELLS - moves) // 2
+            else:
+                # a column is best when the opponent scores no more than -score after it,
+                # which a single null-window search answers
+                child_score = self.negamax(
+                    opponent, child_occupied, moves + 1, -score, -score + 1
+                )
+            if child_score <= -score:
+                return score, column
+        return score, None
 
-    return False
+
+class SolverCache:
+    """
+    Solved positions kept on disk in an sqlite database, so a position
+    solved once is answered from the cache in later runs too. A position
+    and its mirror image are stored once, under canonical_key. When the
+    cache holds more than max_entries positions, the oldest tenth of
+    them is removed.
+
+    The cache can be rebuilt by solving the positions again, so it is
+    written without waiting for the disk.
+    """
+
+    def __init__(self, path=SOLVER_CACHE_PATH, max_entries=SOLVER_CACHE_ENTRIES):
+        """
+        :param path: Path of the database, created if it does not exist yet, string.
+        :param max_entries: Most positions kept, int.
+        """
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA synchronous = OFF")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS solved ("
+                "key INTEGER PRIMARY KEY, score INTEGER NOT NULL, "
+                "column INTEGER NOT NULL, stored REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS solved_stored ON solved (stored)"
+            )
+        (self.entries,) = self.connection.execute(
+            "SELECT COUNT(*) FROM solved"
+        ).fetchone()
+
+    def get(self, key):
+        """
+        :param key: Key of the position from Bitboard.key, int.
+        :return: Score and best column of the position, tuple of two ints, or None if it is not cached.
+        """
+        key, mirrored = canonical_key(key)
+        row = self.connection.execute(
+            "SELECT score, column FROM solved WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None and mirrored:
+            return row[0], mirror_column(row[1])
+        return row
+
+    def put(self, key, score, column):
+        """
+        Stores a solved position, removing the oldest positions if the cache is full.
+
+        :param key: Key of the position from Bitboard.key, int.
+        :param score: Score of the position for the player to move, int.
+        :param column: Best column starting at 1, int.
+        :return: None
+        """
+        key, mirrored = canonical_key(key)
+        if mirrored:
+            column = mirror_column(column)
+        with self.connection:
+            added = self.connection.execute(
+                "INSERT OR IGNORE INTO solved VALUES (?, ?, ?, ?)",
+                (key, score, column, time.time()),
+            ).rowcount
+            self.entries += added
+            if self.entries > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM solved WHERE key IN "
+                    "(SELECT key FROM solved ORDER BY stored LIMIT ?)",
+                    (self.entries - self.max_entries + self.max_entries // 10,),
+                )
+                (self.entries,) = self.connection.execute(
+                    "SELECT COUNT(*) FROM solved"
+                ).fetchone()
+
+    def close(self):
+        """
+        Closes the database.
+
+        :return: None
+        """
+        self.connection.close()
+
+
+# solver state shared by every call to solve, created the first time it is needed
+solver_cache = None
+solver_transposition_table = None
+
+
+def get_solver_cache():
+    """
+    Returns the solver cache at SOLVER_CACHE_PATH, opening it on first use.
+
+    :return: The shared cache, SolverCache.
+    """
+    global solver_cache
+    if solver_cache is None:
+        solver_cache = SolverCache()
+    return solver_cache
+
+
+def solve(board, player=None, cache=None):
+    """
+    Finds the exact value of a position with perfect play from both
+    players, see Solver for how scores are counted. Positions are
+    looked up in the solver cache first and added to it once solved.
+    Positions late in the game solve in moments, while ones close to
+    the start of the game can take a very long time.
+
+    :param board: The game board, 2D list of 6x7 dimensions or a Bitboard.
+    :param player: The player to move, integer value of 1 or 2, defaults to the one with fewer pieces or player 1.
+    :param cache: Cache of solved positions, SolverCache, defaults to the shared cache.
+    :return: Score for the player to move and the best column starting at 1, or None on a full board, tuple.
+    :raises ValueError: If the game is already won.
+    """
+    global solver_transposition_table
+    bitboard = board if isinstance(board, Bitboard) else Bitboard.from_board(board)
+    if bitboard.result() in (1, 2):
+        raise ValueError("The game is already over")
+    if player is None:
+        player = 1 if bin(bitboard.pieces[1]).count("1") == bitboard.moves // 2 else 2
+    if bitboard.moves == NUM_CELLS:
+        return 0, None
+
+    if cache is None:
+        cache = get_solver_cache()
+    key = bitboard.key(player)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    if solver_transposition_table is None:
+        solver_transposition_table = TranspositionTable()
+    occupied = bitboard.pieces[1] | bitboard.pieces[2]
+    score, column = Solver(solver_transposition_table).best_move(
+        bitboard.pieces[player], occupied, bitboard.moves
+    )
+    cache.put(key, score, column)
+    return score, column
+
+
+class OpeningBook:
+    """
+    Read-only view of an opening book file: a short header followed by
+    fixed size records of position key, best column, depth searched and
+    score, sorted by key. The file is memory-mapped and binary searched,
+    so it is never parsed and a lookup only touches a few records. A
+    position and its mirror image are stored once, under canonical_key.
+    """
+
+    MAGIC = b"C4BK"
+    # magic, format version and number of plies covered
+    HEADER = struct.Struct("<4sHH")
+    # Bitboard.key, best column, depth searched and score
+    RECORD = struct.Struct("<QBBi")
+    VERSION = 1
+
+    def __init__(self, path):
+        """
+        :param path: Path of the opening book file, string.
+        """
+        with open(path, "rb") as book_file:
+            self.data = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.plies = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            self.data.close()
+            raise ValueError(path + " is not a Connect 4 opening book")
+        self.records = (len(self.data) - self.HEADER.size) // self.RECORD.size
+
+    def close(self):
+        """
+        Unmaps the opening book file.
+
+        :return: None
+        """
+        self.data.close()
+
+    def lookup(self, key):
+        """
+        Finds the entry of a position in the book.
+
+        :param key: Key of the position from Bitboard.key, int.
+        :return: Best column, depth searched and score, tuple of three ints, or None if the position is not in the book.
+        """
+        key, mirrored = canonical_key(key)
+        low = 0
+        high = self.records
+        while low < high:
+            middle = (low + high) // 2
+            offset = self.HEADER.size + middle * self.RECORD.size
+            record_key, column, depth, score = self.RECORD.unpack_from(
+                self.data, offset
+            )
+            if record_key == key:
+                if mirrored:
+                    column = mirror_column(column)
+                return column, depth, score
+            if record_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
 
 
-def game_against_cpu():
+# opening book used by the expert CPU, loaded the first time it is needed
+expert_opening_book = None
+
+
+def get_opening_book():
+    """
+    Returns the opening book at OPENING_BOOK_PATH, mapping it into
+    memory on first use.
+
+    :return: The opening book, OpeningBook, or None if no book has been generated.
+    """
+    global expert_opening_book
+    if expert_opening_book is None and os.path.exists(OPENING_BOOK_PATH):
+        expert_opening_book = OpeningBook(OPENING_BOOK_PATH)
+    return expert_opening_book
+
+
+def generate_opening_book(
+    path=OPENING_BOOK_PATH,
+    plies=OPENING_BOOK_PLIES,
+    time_limit=OPENING_BOOK_TIME_LIMIT,
+):
+    """
+    Searches every position reachable in the first plies moves of a
+    game and writes the results to an opening book file. Positions
+    reached through different move orders, and mirror images of each
+    other, are only searched once, and positions where the game is
+    already over are left out.
+
+    :param path: Path of the opening book file to write, string.
+    :param plies: Number of moves from the start of the game to cover, int.
+    :param time_limit: Seconds to search each position for, float.
+    :return: Number of positions written, int.
+    """
+    table = TranspositionTable()
+    records = []
+    positions = [Bitboard()]
+    for ply in range(plies + 1):
+        player = 1 if ply % 2 == 0 else 2
+        print(
+            "Searching "
+            + str(len(positions))
+            + " positions after "
+            + str(ply)
+            + " moves"
+        )
+        next_positions = {}
+        for bitboard in positions:
+            deadline = time.perf_counter() + time_limit
+            result = NegamaxSearch(deadline, table).iterative_deepening(
+                bitboard, player, NUM_ROWS * NUM_COLUMNS
+            )
+            key, mirrored = canonical_key(bitboard.key(player))
+            column = mirror_column(result.column) if mirrored else result.column
+            records.append((key, column, result.depth, result.score))
+            if ply == plies:
+                continue
+            for column in range(1, NUM_COLUMNS + 1):
+                if bitboard.can_drop(column) and not bitboard.is_winning_drop(
+                    player, column
+                ):
+                    child = bitboard.copy()
+                    child.drop(player, column)
+                    next_positions[canonical_key(child.key(3 - player))[0]] = child
+        positions = list(next_positions.values())
+
+    records.sort()
+    with open(path, "wb") as book_file:
+        book_file.write(
+            OpeningBook.HEADER.pack(OpeningBook.MAGIC, OpeningBook.VERSION, plies)
+        )
+        for record in records:
+            book_file.write(OpeningBook.RECORD.pack(*record))
+    return len(records)
+
+
+# a game from a record archive: the columns played in order, the result
+# with the values of end_of_game and the kind of game, one of the RECORD_ constants
+GameRecord = namedtuple("GameRecord", ["moves", "result", "kind"])
+
+# the low and high nibble of every byte, the order two moves are packed in
+RECORD_NIBBLES = tuple((byte & 15, byte >> 4) for byte in range(256))
+
+
+class GameRecordWriter:
+    """
+    Appends games to a record archive: a short header, then one record
+    per game of a byte with the number of moves, a byte with the kind of
+    game and its result, and the moves packed two to a byte. A full game
+    of 42 moves takes 23 bytes.
+
+    Records are buffered and written with single appending writes of
+    whole records, so several processes can add games to the same
+    archive, as long as it was created before they start.
+    """
+
+    MAGIC = b"C4GR"
+    # magic and format version
+    HEADER = struct.Struct("<4sH")
+    VERSION = 1
+
+    def __init__(self, path):
+        """
+        :param path: Path of the archive, created if it does not exist yet, string.
+        """
+        self.buffer = bytearray()
+        self.file = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if os.fstat(self.file).st_size == 0:
+            os.write(self.file, self.HEADER.pack(self.MAGIC, self.VERSION))
+        else:
+            with open(path, "rb") as archive:
+                header = archive.read(self.HEADER.size)
+            if header != self.HEADER.pack(self.MAGIC, self.VERSION):
+                os.close(self.file)
+                raise ValueError(path + " is not a Connect 4 game record archive")
+
+    def write(self, moves, result, kind=RECORD_HEADLESS):
+        """
+        Adds a game to the archive.
+
+        :param moves: The columns played in order, starting at 1, list of ints.
+        :param result: The result of the game with the values of end_of_game, int.
+        :param kind: How the game was played, one of the RECORD_ constants, int.
+        :return: None
+        """
+        buffer = self.buffer
+        buffer.append(len(moves))
+        buffer.append(kind << 4 | result)
+        for index in range(0, len(moves) - 1, 2):
+            buffer.append(moves[index] | moves[index + 1] << 4)
+        if len(moves) % 2:
+            buffer.append(moves[-1])
+        if len(buffer) >= GAME_RECORD_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered records to the archive.
+
+        :return: None
+        """
+        if self.buffer:
+            os.write(self.file, self.buffer)
+            self.buffer.clear()
+
+    def close(self):
+        """
+        Writes the buffered records and closes the archive.
+
+        :return: None
+        """
+        self.flush()
+        os.close(self.file)
+
+
+def record_game(path, moves, result, kind):
+    """
+    Appends a single game to a record archive.
+
+    :param path: Path of the archive, string.
+    :param moves: The columns played in order, starting at 1, list of ints.
+    :param result: The result of the game with the values of end_of_game, int.
+    :param kind: How the game was played, one of the RECORD_ constants, int.
+    :return: None
+    """
+    writer = GameRecordWriter(path)
+    try:
+        writer.write(moves, result, kind)
+    finally:
+        writer.close()
+
+
+def read_game_records(path, chunk_size=GAME_RECORD_CHUNK_SIZE):
+    """
+    Reads the games of a record archive one at a time. The archive is
+    read in chunks, so archives far larger than memory can be scanned.
+
+    :param path: Path of the archive, string.
+    :param chunk_size: Number of bytes read at once, int.
+    :return: Generator of the games in the order they were written, GameRecord.
+    """
+    with open(path, "rb") as archive:
+        header = archive.read(GameRecordWriter.HEADER.size)
+        if header != GameRecordWriter.HEADER.pack(
+            GameRecordWriter.MAGIC, GameRecordWriter.VERSION
+        ):
+            raise ValueError(path + " is not a Connect 4 game record archive")
+        data = b""
+        while True:
+            chunk = archive.read(chunk_size)
+            if not chunk:
+                break
+            # a record can be split between two chunks, its start is kept for the next one
+            data = data + chunk if data else chunk
+            offset = 0
+            end = len(data)
+            while offset + 2 <= end:
+                move_count = data[offset]
+                record_end = offset + 2 + (move_count + 1) // 2
+                if record_end > end:
+                    break
+                moves = [
+                    move
+                    for byte in data[offset + 2 : record_end]
+                    for move in RECORD_NIBBLES[byte]
+                ]
+                if move_count % 2:
+                    moves.pop()
+                info = data[offset + 1]
+                yield GameRecord(moves, info & 15, info >> 4)
+                offset = record_end
+            data = data[offset:]
+        if data:
+            raise ValueError(path + " ends with an incomplete game record")
+
+
+def replay_game_record(record):
+    """
+    Plays the moves of a recorded game onto a new board.
+
+    :param record: The recorded game, GameRecord or a list of columns.
+    :return: The game after the last move, Game.
+    :raises ValueError: If a move of the record is not a legal move.
+    """
+    moves = record.moves if isinstance(record, GameRecord) else record
+    game = Game()
+    for column in moves:
+        game.apply_move(column)
+    return game
+
+
+class MCTSNode:
+    """
+    A position in a Monte Carlo search tree, reached by dropping a
+    piece into column. wins counts the rollouts won by the player who
+    made that move, with a draw counting as half a win.
+    """
+
+    __slots__ = ("column", "player", "parent", "children", "untried", "visits", "wins")
+
+    def __init__(self, column, player, parent, untried):
+        """
+        :param column: Column of the move that reached this position, int, 0 for the root.
+        :param player: The player who made that move, int.
+        :param parent: The position before the move, MCTSNode or None for the root.
+        :param untried: Legal columns not yet expanded into children, list of ints.
+        """
+        self.column = column
+        self.player = player
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0.0
+
+    def select_child(self):
+        """
+        Picks the child with the highest UCT score, which balances the
+        children's win rate against how rarely they have been visited.
+
+        :return: The chosen child, MCTSNode.
+        """
+        log_visits = math.log(self.visits)
+        return max(
+            self.children,
+            key=lambda child: child.wins / child.visits
+            + MCTS_EXPLORATION * math.sqrt(log_visits / child.visits),
+        )
+
+
+def rollout(bitboard, player, policy="medium"):
+    """
+    Plays a game out to the end from a position and then takes every
+    rollout move back, leaving the bitboard as it was. The easy policy
+    plays random columns, the medium policy first takes an immediate
+    win, then blocks one of the opponent, like cpu_player_medium.
+
+    :param bitboard: The position to play from, Bitboard.
+    :param player: The player to move, int.
+    :param policy: "easy" or "medium", string.
+    :return: 1 if player 1 wins, 2 if player 2 wins, 3 if draw.
+    """
+    played = 0
+    game_result = 3
+    while bitboard.moves < NUM_ROWS * NUM_COLUMNS:
+        legal_columns = bitboard.legal_moves()
+        column = None
+        if policy == "medium":
+            for candidate in legal_columns:
+                if bitboard.is_winning_drop(player, candidate):
+                    column = candidate
+                    break
+            else:
+                for candidate in legal_columns:
+                    if bitboard.is_winning_drop(3 - player, candidate):
+                        column = candidate
+                        break
+        if column is None:
+            column = random.choice(legal_columns)
+
+        wins = bitboard.is_winning_drop(player, column)
+        bitboard.drop(player, column)
+        played += 1
+        if wins:
+            game_result = player
+            break
+        player = 3 - player
+
+    for _ in range(played):
+        bitboard.undo()
+    return game_result
+
+
+class MonteCarloTreeSearch:
+    """
+    Monte Carlo tree search CPU using UCT. Each iteration walks down the
+    tree to a position with an untried move, adds it, plays a rollout
+    from there and counts the result along the path. The search tree is
+    kept between moves, so the part of it below the moves actually played
+    is reused by the next search.
+
+    With more than one worker, the other workers each grow their own tree
+    from the same position in a process pool and their visit counts for
+    the first move are added to this tree's before picking a column.
+    Call close once done to shut the pool down.
+    """
+
+    def __init__(self, iterations=None, time_limit=None, workers=1, policy="medium"):
+        """
+        :param iterations: Number of iterations each tree searches per move, int.
+        :param time_limit: Seconds each move may take, float. When neither limit is given, MCTS_TIME_LIMIT is used.
+        :param workers: Number of trees searched at the same time, int.
+        :param policy: Rollout policy, "easy" or "medium", string.
+        """
+        if iterations is None and time_limit is None:
+            time_limit = MCTS_TIME_LIMIT
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.workers = workers
+        self.policy = policy
+        self.executor = None
+        self.root = None
+        self.root_bitboard = None
+        self.root_player = None
+
+    def close(self):
+        """
+        Shuts down the worker process pool.
+
+        :return: None
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def find_root(self, bitboard, player):
+        """
+        Finds the position in the kept tree reached from the previous
+        root by the two moves played since, and makes it the root.
+
+        :param bitboard: The current position, Bitboard.
+        :param player: The player to move, int.
+        :return: The root to search from, MCTSNode.
+        """
+        if self.root is not None and self.root_player == player:
+            key = bitboard.key(player)
+            previous = self.root_bitboard
+            for child in self.root.children:
+                previous.drop(child.player, child.column)
+                for grandchild in child.children:
+                    previous.drop(grandchild.player, grandchild.column)
+                    found = previous.key(player) == key
+                    previous.undo()
+                    if found:
+                        previous.undo()
+                        grandchild.parent = None
+                        return grandchild
+                previous.undo()
+
+        legal_columns = bitboard.legal_moves()
+        return MCTSNode(0, 3 - player, None, legal_columns)
+
+    def grow(self, root, bitboard, player):
+        """
+        Runs iterations on a tree until the iteration or time limit is
+        reached. The first iteration always runs, so the root has a child
+        to pick even when the time limit is used up before the search starts.
+
+        :param root: The root of the tree, MCTSNode.
+        :param bitboard: The position at the root, Bitboard.
+        :param player: The player to move at the root, int.
+        :return: None
+        """
+        deadline = None
+        if self.time_limit is not None:
+            deadline = time.perf_counter() + self.time_limit
+        iteration = 0
+        while iteration == 0 or (
+            (self.iterations is None or iteration < self.iterations)
+            and (deadline is None or time.perf_counter() < deadline)
+        ):
+            iteration += 1
+            node = root
+            to_move = player
+            played = 0
+            game_result = 0
+
+            # selection, down through fully expanded positions
+            while not node.untried and node.children:
+                node = node.select_child()
+                bitboard.drop(node.player, node.column)
+                played += 1
+                to_move = 3 - to_move
+            if bitboard.is_winner(node.player):
+                game_result = node.player
+            elif bitboard.moves == NUM_ROWS * NUM_COLUMNS:
+                game_result = 3
+
+            # expansion of one untried move
+            if game_result == 0 and node.untried:
+                column = node.untried.pop(random.randrange(len(node.untried)))
+                wins = bitboard.is_winning_drop(to_move, column)
+                bitboard.drop(to_move, column)
+                played += 1
+                untried = []
+                if not wins:
+                    untried = [
+                        candidate
+                        for candidate in range(1, NUM_COLUMNS + 1)
+                        if bitboard.can_drop(candidate)
+                    ]
+                child = MCTSNode(column, to_move, node, untried)
+                node.children.append(child)
+                node = child
+                to_move = 3 - to_move
+                if wins:
+                    game_result = node.player
+                elif bitboard.moves == NUM_ROWS * NUM_COLUMNS:
+                    game_result = 3
+
+            # simulation
+            if game_result == 0:
+                game_result = rollout(bitboard, to_move, self.policy)
+
+            # backpropagation
+            while node is not None:
+                node.visits += 1
+                if game_result == node.player:
+                    node.wins += 1.0
+                elif game_result == 3:
+                    node.wins += 0.5
+                node = node.parent
+            for _ in range(played):
+                bitboard.undo()
+
+    def move(self, board, player):
+        """
+        Searches the board and drops a piece into the column whose
+        subtree was visited most across every tree.
+
+        :param board: The game board, 2D list of 6x7 dimensions.
+        :param player: The player whose turn it is, integer value of 1 or 2.
+        :return: Column that the piece was dropped into, int.
+        """
+        bitboard = Bitboard.from_board(board)
+        root = self.find_root(bitboard, player)
+
+        pending = []
+        if self.workers > 1:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers - 1)
+            pending = [
+                self.executor.submit(
+                    search_mcts_root,
+                    board,
+                    player,
+                    self.iterations,
+                    self.time_limit,
+                    self.policy,
+                )
+                for _ in range(self.workers - 1)
+            ]
+        self.grow(root, bitboard, player)
+
+        visits = {child.column: child.visits for child in root.children}
+        for future in pending:
+            for column, worker_visits in future.result().items():
+                visits[column] = visits.get(column, 0) + worker_visits
+        column = max(visits, key=visits.get)
+
+        self.root = root
+        self.root_bitboard = bitboard
+        self.root_player = player
+        drop_piece(board, player, column)
+        return column
+
+
+def search_mcts_root(board, player, iterations, time_limit, policy):
+    """
+    Grows a fresh Monte Carlo search tree in a worker process.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param player: The player whose turn it is, integer value of 1 or 2.
+    :param iterations: Number of iterations to search, int or None.
+    :param time_limit: Seconds to search for, float or None.
+    :param policy: Rollout policy, "easy" or "medium", string.
+    :return: Visits of each column at the root, dict of int to int.
+    """
+    # forked workers start with the parent's random state, so every tree is reseeded
+    random.seed()
+    search = MonteCarloTreeSearch(iterations, time_limit, 1, policy)
+    bitboard = Bitboard.from_board(board)
+    root = search.find_root(bitboard, player)
+    search.grow(root, bitboard, player)
+    return {child.column: child.visits for child in root.children}
+
+
+def cpu_player_mcts(board, player, iterations=None, time_limit=None, workers=1):
+    """
+    Executes a move for the CPU with Monte Carlo tree search,
+    playing the column whose rollouts went best. To reuse the
+    search tree between moves, use a MonteCarloTreeSearch instead.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param player: The player whose turn it is, integer value of 1 or 2.
+    :param iterations: Number of iterations each tree searches, int.
+    :param time_limit: Seconds the move may take, float. When neither limit is given, MCTS_TIME_LIMIT is used.
+    :param workers: Number of trees searched at the same time in separate processes, int.
+    :return: Column that the piece was dropped into, int.
+    """
+    search = MonteCarloTreeSearch(iterations, time_limit, workers)
+    try:
+        return search.move(board, player)
+    finally:
+        search.close()
+
+
+# process pool of analyze_moves, kept between calls so the workers keep their
+# transposition tables, and the number of workers it was started with
+analysis_executor = None
+analysis_workers = 0
+
+
+def start_analysis_worker():
     """
-    Runs a game of Connect 4 against the computer.
+    Prepares a new worker process of analyze_moves. Forked workers start
+    with the random state and open solver cache of the parent, so they
+    are reseeded and open a connection to the cache of their own.
 
     :return: None
     """
-    # Implement your solution below
+    global solver_cache
+    random.seed()
+    solver_cache = None
+
+
+def get_analysis_executor(workers):
+    """
+    Returns the process pool of analyze_moves, starting it on first use
+    or when a different number of workers is asked for.
+
+    :param workers: Number of worker processes, int.
+    :return: The pool, ProcessPoolExecutor.
+    """
+    global analysis_executor, analysis_workers
+    if analysis_executor is None or analysis_workers != workers:
+        if analysis_executor is not None:
+            analysis_executor.shutdown()
+        analysis_executor = ProcessPoolExecutor(
+            workers, initializer=start_analysis_worker
+        )
+        analysis_workers = workers
+    return analysis_executor
+
+
+def analyze_column(
+    board, player, column, engine, depth, time_limit, playouts, variant=None
+):
+    """
+    Scores one column of a position for analyze_moves, in the worker
+    process that runs it.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param player: The player whose turn it is, integer value of 1 or 2.
+    :param column: The column to score, starting at 1, int.
+    :param engine: "solve", "expert" or the name of a CPU strategy from get_cpu_players, string.
+    :param depth: Deepest number of moves the expert searches ahead, counting this one, int or None.
+    :param time_limit: Seconds the expert may search, float or None.
+    :param playouts: Number of games a CPU strategy plays out, int.
+    :param variant: Rules of the game, Variant or None for the standard game.
+    :return: Score of the column for the player, see analyze_moves, int.
+    """
+    if engine in ("solve", "expert"):
+        bitboard = Bitboard.from_board(board)
+        if bitboard.is_winning_drop(player, column):
+            if engine == "solve":
+                return (NUM_CELLS + 1 - bitboard.moves) // 2
+            return WIN_SCORE - bitboard.moves - 1
+        bitboard.drop(player, column)
+        if engine == "solve":
+            return -solve(bitboard, 3 - player)[0]
+        if depth is None:
+            depth = NUM_CELLS
+            if time_limit is None:
+                time_limit = EXPERT_TIME_LIMIT
+        deadline = None
+        if time_limit is not None:
+            deadline = time.perf_counter() + time_limit
+        result = NegamaxSearch(
+            deadline, get_expert_transposition_table()
+        ).iterative_deepening(bitboard, 3 - player, depth - 1)
+        return -result.score
+
+    if variant is None:
+        variant = STANDARD_VARIANT
+    cpu_player = get_cpu_players(variant)[engine]
+    pieces = sum(1 for row in board for cell in row if cell != 0)
+    start_heights = [
+        sum(1 for row in board if row[col] != 0) for col in range(variant.num_columns)
+    ]
+    score = 0
+    for _ in range(playouts):
+        playout = [row[:] for row in board]
+        heights = start_heights[:]
+        row = make_move(playout, player, column)
+        heights[column - 1] += 1
+        move_count = pieces + 1
+        game_result = check_move_result(
+            playout, row, column - 1, move_count, variant.connect
+        )
+        to_move = 3 - player
+        while game_result == 0:
+            move = cpu_player(playout, to_move)
+            move_count += 1
+            heights[move - 1] += 1
+            game_result = check_move_result(
+                playout,
+                variant.num_rows - heights[move - 1],
+                move - 1,
+                move_count,
+                variant.connect,
+            )
+            to_move = 3 - to_move
+        if game_result == player:
+            score += 1
+        elif game_result == 3 - player:
+            score -= 1
+    return score
+
+
+def analysis_engines(variant=None):
+    """
+    Lists the engines analyze_moves can score columns with. The MCTS
+    strategy is left out, since it searches for a second every move and
+    playing hundreds of games out with it after every column would take
+    hours.
+
+    :param variant: Rules of the game, Variant or None for the standard game.
+    :return: Names of the engines, sorted, list of strings.
+    """
+    engines = [name for name in get_cpu_players(variant) if name != "mcts"]
+    if variant is None or variant is STANDARD_VARIANT:
+        engines.append("solve")
+    return sorted(engines)
 
+
+def analyze_moves(
+    board,
+    player,
+    engine="expert",
+    workers=None,
+    depth=None,
+    time_limit=None,
+    playouts=ANALYSIS_PLAYOUTS,
+    variant=None,
+):
+    """
+    Scores every legal column of a position at once, with the columns
+    spread over a pool of worker processes, so a deep analysis takes
+    about as long as the slowest column instead of all of them in turn.
+    The board is left unchanged.
+
+    The engine decides what a score means. "solve" scores a column with
+    the exact value of perfect play, see Solver, through the solver
+    cache every worker reads and adds to. "expert" scores it with a
+    negamax search, see search_position for the depth and time limit,
+    and every worker keeps its transposition table from one call to the
+    next. Any CPU strategy from get_cpu_players but mcts scores a
+    column by playing games out after it with the strategy moving for
+    both players, as the share of games won minus the share lost. With
+    more workers than columns, the games of a column are split over
+    several workers.
+
+    Every column is searched on its own with a full window, since
+    searching it against the best score found so far would only bound
+    the score of the worse columns instead of finding it.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param player: The player whose turn it is, integer value of 1 or 2.
+    :param engine: "solve", "expert" or the name of a CPU strategy from get_cpu_players other than "mcts", string.
+    :param workers: Number of worker processes, int, defaults to the number of CPUs. With 1 the columns are scored in this process.
+    :param depth: Deepest number of moves the expert searches ahead, int.
+    :param time_limit: Seconds the expert may search each column, float.
+    :param playouts: Number of games played out after each column by a CPU strategy, int.
+    :param variant: Rules of the game, Variant or None for the standard game. Only CPU strategies play other variants.
+    :return: Score of every legal column for the player, higher is better, dict of int to int or float.
+    :raises ValueError: If the engine is unknown or cannot play the variant, or the game is already over.
+    """
+    if variant is None:
+        variant = STANDARD_VARIANT
+    engines = analysis_engines(variant)
+    if engine not in engines:
+        raise ValueError("Unknown analysis engine for this board: " + engine)
+    if end_of_game(board, variant) != 0:
+        raise ValueError("The game is already over")
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    columns = [
+        column
+        for column in range(1, variant.num_columns + 1)
+        if board[0][column - 1] == 0
+    ]
+    # the games of a column are played out in as many shares as it takes to give
+    # every worker something to do
+    shares = 1
+    if engine not in ("solve", "expert"):
+        shares = max(1, min(playouts, -(-workers // len(columns))))
+    tasks = [
+        (column, playouts // shares + (share < playouts % shares))
+        for column in columns
+        for share in range(shares)
+    ]
+    arguments = (
+        [board] * len(tasks),
+        [player] * len(tasks),
+        [column for column, _ in tasks],
+        [engine] * len(tasks),
+        [depth] * len(tasks),
+        [time_limit] * len(tasks),
+        [share_playouts for _, share_playouts in tasks],
+        [variant] * len(tasks),
+    )
+    if workers == 1:
+        results = list(map(analyze_column, *arguments))
+    else:
+        results = list(get_analysis_executor(workers).map(analyze_column, *arguments))
+
+    scores = dict.fromkeys(columns, 0)
+    for (column, _), score in zip(tasks, results):
+        scores[column] += score
+    if engine not in ("solve", "expert"):
+        for column in columns:
+            scores[column] /= playouts
+    return scores
+
+
+def game_against_cpu(delay=RETURN_TO_MENU_DELAY, record_path=None, variant=None):
+    """
+    Runs a game of Connect 4 against the computer. The expert and MCTS
+    difficulties search bitboards of the standard board, so only the
+    other difficulties are offered on other variants.
+
+    :param delay: Seconds the final board stays up before returning, float.
+    :param record_path: Game record archive to append the game to, string or None to not record it.
+    :param variant: Rules of the game, Variant or None for the standard game.
+    :return: 1 if the user wins, 2 if the CPU wins, 3 if draw.
+    """
     clear_screen()
-    board = create_board()
+    game = Game(variant)
+    variant = game.variant
     valid_option = False
 
-    # is_user_turn checks if it player 1 turn or not
-    is_user_turn = True
-    # is_board_blank checks if the board is blank
-    is_board_blank = True
     # display_previous_move shows a message of the player dropping a piece in which column
     display_previous_move = ""
 
-    display_count = 0
-
-    difficulty_option = int(
-        input("Select CPU difficulty level of Easy (1), Medium (2), Hard (3): ")
+    difficulties = ["Easy", "Medium", "Hard"]
+    if variant is STANDARD_VARIANT:
+        difficulties += ["Expert", "MCTS"]
+    prompt = (
+        "Select CPU difficulty level of "
+        + ", ".join(
+            name + " (" + str(option) + ")"
+            for option, name in enumerate(difficulties, 1)
+        )
+        + ": "
     )
+    difficulty_option = int(input(prompt))
 
     while not valid_option:
-        if difficulty_option == 1 or difficulty_option == 2 or difficulty_option == 3:
+        if 1 <= difficulty_option <= len(difficulties):
             valid_option = True
         else:
             print("Invalid Option selected. Try again")
             print("Choose an option of the following")
-            print("Easy: 1")
-            print("Medium: 2")
-            print("Hard: 3")
-            difficulty_option = int(
-                input("Select CPU difficulty level of Easy (1), Medium (2), Hard (3): ")
-            )
+            for option, name in enumerate(difficulties, 1):
+                print(name + ": " + str(option))
+            difficulty_option = int(input(prompt))
 
-    while end_of_game(board) == 0:
-        clear_screen()
-        print_board(board)
+    # the tree search keeps its tree and worker processes for the whole game
+    if difficulty_option == 5:
+        tree_search = MonteCarloTreeSearch(workers=os.cpu_count() or 1)
 
-        if not is_board_blank and display_count % 2 == 0:
-            print(display_previous_move)
-
-        if is_user_turn:
-            move = execute_player_turn(1, board)
+    while game.result() == 0:
+        if game.player == 1:
+            # the moves of both players are shown once the CPU has answered
+            render_game(game, display_previous_move)
+            move = execute_player_turn(game)
             display_previous_move = "Player 1 dropped a piece into column " + str(move)
-            is_user_turn = False
-            is_board_blank = False
-            display_count += 1
         else:
+            render_game(game)
+            # the CPU players drop their piece into the board they are given,
+            # so they move on a copy and the move is applied to the game
+            board = [row[:] for row in game.board]
             if difficulty_option == 1:
-                move = cpu_player_easy(board, 2)
+                move = cpu_player_easy(board, 2, variant)
             elif difficulty_option == 2:
-                move = cpu_player_medium(board, 2)
+                move = cpu_player_medium(board, 2, variant)
             elif difficulty_option == 3:
-                move = cpu_player_hard(board, 2)
+                move = cpu_player_hard(board, 2, variant=variant)
+            elif difficulty_option == 4:
+                search_result = search_position(board, 2)
+                move = search_result.column
+            elif difficulty_option == 5:
+                move = tree_search.move(board, 2)
             display_previous_move += (
                 "\nPlayer 2 (CPU) dropped a piece into column " + str(move)
             )
-            is_user_turn = True
-            display_count += 1
+            if difficulty_option == 4:
+                display_previous_move += (
+                    " (searched "
+                    + str(search_result.depth)
+                    + " moves ahead, "
+                    + str(search_result.nodes)
+                    + " positions at "
+                    + str(round(search_result.nodes_per_second))
+                    + " positions/sec)"
+                )
+            game.apply_move(move)
+
+    if difficulty_option == 5:
+        tree_search.close()
 
     # print the board one final time to show the end of the game
-    print_board(board)
-    if end_of_game(board) == 1:
-        print("You won against the CPU!")
-    elif end_of_game(board) == 2:
-        print("Bad luck. You lost to the CPU")
+    if game.result() == 1:
+        message = "You won against the CPU!"
+    elif game.result() == 2:
+        message = "Bad luck. You lost to the CPU"
+    else:
+        message = "It is a draw!"
+    render_game(game, message)
+    # records only hold games of the standard game
+    if record_path and variant is STANDARD_VARIANT:
+        record_game(record_path, game.history, game.result(), RECORD_AGAINST_CPU)
+
+    print("Game will be returning to the main lobby in " + str(delay) + " seconds")
+    time.sleep(delay)
+    return game.result()
+
+
+# outcome of a tournament from the first strategy's point of view, and the seconds it took
+# hard_cache holds the hits, misses and evictions of the hard move caches, or None without them
+TournamentResult = namedtuple(
+    "TournamentResult",
+    ["games", "wins", "draws", "losses", "elapsed", "hard_cache"],
+    defaults=(None,),
+)
+
+
+def get_cpu_players(variant=None, hard_cache=None):
+    """
+    Returns the CPU strategies that can play headless games by name. On
+    variants other than the standard game, the strategies are given the
+    variant, and the expert and MCTS strategies that only search the
+    standard board are left out.
+
+    :param variant: Rules of the games, Variant or None for the standard game.
+    :param hard_cache: Cache of the hard moves, HardMoveCache or None to play without one.
+    :return: Mapping of difficulty name to CPU player function, dict.
+    """
+    cpu_player_hard_cached = cpu_player_hard
+    if hard_cache is not None:
+        cpu_player_hard_cached = partial(cpu_player_hard, cache=hard_cache)
+    if variant is not None and variant is not STANDARD_VARIANT:
+        return {
+            "easy": partial(cpu_player_easy, variant=variant),
+            "medium": partial(cpu_player_medium, variant=variant),
+            "hard": partial(cpu_player_hard, variant=variant, cache=hard_cache),
+        }
+    return {
+        "easy": cpu_player_easy,
+        "medium": cpu_player_medium,
+        "hard": cpu_player_hard_cached,
+        "expert": cpu_player_expert,
+        "mcts": cpu_player_mcts,
+    }
+
+
+def play_cpu_game(player_1_cpu, player_2_cpu, recorder=None, variant=None):
+    """
+    Plays a game of Connect 4 between two CPU players without
+    any input or output.
+
+    :param player_1_cpu: CPU player function that moves first.
+    :param player_2_cpu: CPU player function that moves second.
+    :param recorder: Archive to add the game to, GameRecordWriter or None to not record it.
+    :param variant: Rules of the game, Variant or None for the standard game. The CPU players must be playing by the same rules, see get_cpu_players.
+    :return: 1 if player 1 wins, 2 if player 2 wins, 3 if draw.
+    """
+    if variant is None:
+        variant = STANDARD_VARIANT
+    board = create_board(variant.num_rows, variant.num_columns)
+    # heights counts the pieces in every column, so the row of each move is known without a search
+    heights = [0] * variant.num_columns
+    cpu_players = (None, player_1_cpu, player_2_cpu)
+    player = 1
+    move_count = 0
+    game_result = 0
+    moves = []
+    while game_result == 0:
+        move = cpu_players[player](board, player)
+        moves.append(move)
+        move_count += 1
+        heights[move - 1] += 1
+        game_result = check_move_result(
+            board,
+            variant.num_rows - heights[move - 1],
+            move - 1,
+            move_count,
+            variant.connect,
+        )
+        player = 3 - player
+    if recorder is not None:
+        recorder.write(moves, game_result, RECORD_HEADLESS)
+    return game_result
+
+
+def play_tournament_chunk(
+    strategy_1,
+    strategy_2,
+    first_game,
+    games,
+    seed,
+    record_path=None,
+    variant=None,
+    hard_cache=0,
+):
+    """
+    Plays a batch of tournament games. The strategies swap sides every
+    game, and the random number generator is seeded from the seed and
+    the index of the first game, so a batch plays the same games
+    whichever worker process runs it.
+
+    :param strategy_1: Name of the first CPU strategy, string.
+    :param strategy_2: Name of the second CPU strategy, string.
+    :param first_game: Index of the first game of the batch in the tournament, int.
+    :param games: Number of games to play, int.
+    :param seed: Seed of the tournament, int.
+    :param record_path: Game record archive to append the games to, string or None to not record them.
+    :param variant: Rules of the games, Variant or None for the standard game.
+    :param hard_cache: Most positions the hard move cache of this process holds, int, 0 to play without one.
+    :return: Wins, draws and losses of the first strategy, and the hits, misses and evictions of the hard move cache during the batch or None, tuple.
+    """
+    random.seed(str(seed) + "-" + str(first_game))
+    cache = get_hard_move_cache(hard_cache) if hard_cache else None
+    cache_before = cache.counts() if cache is not None else None
+    cpu_players = get_cpu_players(variant, cache)
+    cpu_1 = cpu_players[strategy_1]
+    cpu_2 = cpu_players[strategy_2]
+    recorder = GameRecordWriter(record_path) if record_path else None
+    wins = draws = losses = 0
+    try:
+        for game in range(first_game, first_game + games):
+            # the first strategy moves first in even games and second in odd ones
+            if game % 2 == 0:
+                game_result = play_cpu_game(cpu_1, cpu_2, recorder, variant)
+                first_strategy_player = 1
+            else:
+                game_result = play_cpu_game(cpu_2, cpu_1, recorder, variant)
+                first_strategy_player = 2
+            if game_result == 3:
+                draws += 1
+            elif game_result == first_strategy_player:
+                wins += 1
+            else:
+                losses += 1
+    finally:
+        if recorder is not None:
+            recorder.close()
+    cache_counts = None
+    if cache is not None:
+        cache_counts = tuple(
+            after - before for after, before in zip(cache.counts(), cache_before)
+        )
+    return wins, draws, losses, cache_counts
+
+
+def run_tournament(
+    strategy_1,
+    strategy_2,
+    games,
+    workers=None,
+    seed=0,
+    record_path=None,
+    variant=None,
+    hard_cache=0,
+):
+    """
+    Plays games between two CPU strategies across a pool of worker
+    processes, with the strategies taking turns to move first.
+
+    :param strategy_1: Name of the first CPU strategy from get_cpu_players, string.
+    :param strategy_2: Name of the second CPU strategy from get_cpu_players, string.
+    :param games: Number of games to play, int.
+    :param workers: Number of worker processes, int, defaults to the number of CPUs. With 1 the games are played in this process.
+    :param seed: Seed for the random moves of the CPU players, int. The same seed plays the same games between the easy, medium and hard strategies, but not with expert or mcts, which search until a time limit and, for expert, reuse the transposition table of the worker process.
+    :param record_path: Game record archive to append every game to, string or None to not record them.
+    :param variant: Rules of the games, Variant or None for the standard game.
+    :param hard_cache: Most positions the hard move cache of each worker process holds, int, 0 to play without one. The caches last from one batch of games to the next.
+    :return: Results of the first strategy, TournamentResult.
+    :raises ValueError: If a strategy cannot play the variant, or games of a variant other than the standard game would be recorded.
+    """
+    cpu_players = get_cpu_players(variant)
+    for strategy in (strategy_1, strategy_2):
+        if strategy not in cpu_players:
+            raise ValueError("Unknown CPU strategy for this board: " + strategy)
+    if record_path and variant is not None and variant is not STANDARD_VARIANT:
+        raise ValueError("Game records only hold games of the standard game")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if record_path:
+        # the archive is created here, so the workers only ever append records to it
+        GameRecordWriter(record_path).close()
+
+    starts = list(range(0, games, TOURNAMENT_CHUNK_SIZE))
+    sizes = [min(TOURNAMENT_CHUNK_SIZE, games - start) for start in starts]
+    arguments = (
+        [strategy_1] * len(starts),
+        [strategy_2] * len(starts),
+        starts,
+        sizes,
+        [seed] * len(starts),
+        [record_path] * len(starts),
+        [variant] * len(starts),
+        [hard_cache] * len(starts),
+    )
+
+    start_time = time.perf_counter()
+    if workers == 1:
+        chunk_results = list(map(play_tournament_chunk, *arguments))
     else:
-        print("It is a draw!")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_results = list(executor.map(play_tournament_chunk, *arguments))
+    elapsed = time.perf_counter() - start_time
+
+    wins = sum(chunk[0] for chunk in chunk_results)
+    draws = sum(chunk[1] for chunk in chunk_results)
+    losses = sum(chunk[2] for chunk in chunk_results)
+    cache_counts = None
+    if hard_cache:
+        cache_counts = tuple(
+            sum(chunk[3][count] for chunk in chunk_results) for count in range(3)
+        )
+    return TournamentResult(games, wins, draws, losses, elapsed, cache_counts)
+
+
+def wilson_interval(successes, total, z=1.96):
+    """
+    Calculates the Wilson score confidence interval of a rate,
+    which stays within 0 and 1 even for rates close to them.
+
+    :param successes: Number of times the outcome happened, int.
+    :param total: Number of trials, int.
+    :param z: Standard score of the confidence level, float, 1.96 for 95%.
+    :return: Lower and upper bound of the rate, tuple of two floats.
+    """
+    if total == 0:
+        return 0.0, 1.0
+    rate = successes / total
+    denominator = 1 + z * z / total
+    centre = (rate + z * z / (2 * total)) / denominator
+    margin = (
+        z * math.sqrt(rate * (1 - rate) / total + z * z / (4 * total * total))
+    ) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def print_tournament_result(strategy_1, strategy_2, result):
+    """
+    Prints the results of a tournament with 95% confidence intervals.
+
+    :param strategy_1: Name of the first CPU strategy, string.
+    :param strategy_2: Name of the second CPU strategy, string.
+    :param result: Results of the first strategy, TournamentResult.
+    :return: None
+    """
+    print("============== Tournament ==============")
+    print(strategy_1 + " vs " + strategy_2 + ", " + str(result.games) + " games")
+    for label, count in (
+        ("Wins", result.wins),
+        ("Draws", result.draws),
+        ("Losses", result.losses),
+    ):
+        low, high = wilson_interval(count, result.games)
+        print(
+            "{:<7} {:>8} {:6.2%}  (95% CI {:.2%} - {:.2%})".format(
+                label, count, count / max(result.games, 1), low, high
+            )
+        )
+    print(
+        "{:.1f} games/sec over {:.1f} seconds".format(
+            result.games / result.elapsed if result.elapsed > 0 else 0.0,
+            result.elapsed,
+        )
+    )
+    if result.hard_cache is not None:
+        print("Hard move cache: " + describe_hard_cache_counts(result.hard_cache))
+    print("========================================")
+
+
+def print_game_record_summary(records):
+    """
+    Prints how many games of each kind an archive holds and how they ended.
+
+    :param records: The games to summarise, iterable of GameRecord.
+    :return: None
+    """
+    kinds = {
+        RECORD_HEADLESS: "CPU vs CPU",
+        RECORD_LOCAL: "Local 2 player",
+        RECORD_AGAINST_CPU: "Against the CPU",
+    }
+    # games, moves, then wins of player 1, wins of player 2 and draws by kind of game
+    totals = {kind: [0, 0, 0, 0, 0] for kind in kinds}
+    for record in records:
+        total = totals.setdefault(record.kind, [0, 0, 0, 0, 0])
+        total[0] += 1
+        total[1] += len(record.moves)
+        if record.result in (1, 2, 3):
+            total[record.result + 1] += 1
+    for kind, (games, moves, player_1, player_2, draws) in totals.items():
+        if games:
+            print(
+                "{}: {} games, {:.1f} moves on average, player 1 won {}, player 2 won {}, {} draws".format(
+                    kinds.get(kind, "Kind " + str(kind)),
+                    games,
+                    moves / games,
+                    player_1,
+                    player_2,
+                    draws,
+                )
+            )
+
+
+def command_line(arguments):
+    """
+    Runs the command given on the command line, or the game
+    menu when no command is given.
+
+    :param arguments: The command line arguments after the script name, list of strings.
+    :return: None
+    """
+    if not arguments:
+        main()
+        return
+
+    parser = argparse.ArgumentParser(prog="connect4.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    play_parser = commands.add_parser("play", help="open the game menu")
+    play_parser.add_argument(
+        "--delay",
+        type=float,
+        default=RETURN_TO_MENU_DELAY,
+        help="seconds the final board of a game stays up",
+    )
+    play_parser.add_argument(
+        "--record",
+        nargs="?",
+        const=GAME_RECORD_PATH,
+        metavar="PATH",
+        help="append every game to this game record archive, "
+        + os.path.basename(GAME_RECORD_PATH)
+        + " when no path is given",
+    )
+
+    book_parser = commands.add_parser(
+        "book", help="generate the opening book used by the expert CPU"
+    )
+    book_parser.add_argument("--plies", type=int, default=OPENING_BOOK_PLIES)
+    book_parser.add_argument(
+        "--time-limit", type=float, default=OPENING_BOOK_TIME_LIMIT
+    )
+    book_parser.add_argument("--output", default=OPENING_BOOK_PATH)
+
+    tournament_parser = commands.add_parser(
+        "tournament", help="play two CPU difficulties against each other"
+    )
+    tournament_parser.add_argument(
+        "--first", choices=sorted(get_cpu_players()), default="hard"
+    )
+    tournament_parser.add_argument(
+        "--second", choices=sorted(get_cpu_players()), default="medium"
+    )
+    tournament_parser.add_argument("--games", type=int, default=1000)
+    tournament_parser.add_argument("--workers", type=int, default=None)
+    tournament_parser.add_argument("--seed", type=int, default=0)
+    tournament_parser.add_argument(
+        "--hard-cache",
+        type=int,
+        default=0,
+        metavar="ENTRIES",
+        help="remember the moves of the hard CPU for this many positions per worker",
+    )
+    tournament_parser.add_argument(
+        "--record", help="game record archive every game is appended to"
+    )
+
+    solve_parser = commands.add_parser(
+        "solve", help="find the exact value of a position with perfect play"
+    )
+    solve_parser.add_argument(
+        "moves",
+        nargs="?",
+        default="",
+        help="columns played from the start of the game, for example 4453",
+    )
+    solve_parser.add_argument("--cache", default=SOLVER_CACHE_PATH)
+
+    records_parser = commands.add_parser(
+        "records", help="summarise or replay the games of a game record archive"
+    )
+    records_parser.add_argument("path", nargs="?", default=GAME_RECORD_PATH)
+    records_parser.add_argument(
+        "--replay", type=int, help="show the final board of the game at this index"
+    )
+
+    analyze_parser = commands.add_parser(
+        "analyze", help="score every column of a position in parallel"
+    )
+    analyze_parser.add_argument(
+        "moves",
+        nargs="?",
+        default="",
+        help="columns played from the start of the game, for example 4453",
+    )
+    analyze_parser.add_argument(
+        "--engine",
+        choices=analysis_engines(),
+        default="expert",
+    )
+    analyze_parser.add_argument("--workers", type=int, default=None)
+    analyze_parser.add_argument("--depth", type=int, default=None)
+    analyze_parser.add_argument("--time-limit", type=float, default=None)
+    analyze_parser.add_argument("--playouts", type=int, default=ANALYSIS_PLAYOUTS)
+
+    profile_parser = commands.add_parser(
+        "profile", help="measure where the hard CPU spends its time"
+    )
+    profile_parser.add_argument(
+        "--opponent", choices=sorted(get_cpu_players()), default="medium"
+    )
+    profile_parser.add_argument("--games", type=int, default=100)
+    profile_parser.add_argument("--seed", type=int, default=0)
+    profile_parser.add_argument(
+        "--profile-dir", help="save a cProfile dump of every game in this directory"
+    )
 
-    print("Game will be returning to the main lobby in 3 seconds")
-    time.sleep(3)
-    main()
+    # the variant of Connect 4 to play, the standard game by default
+    for variant_parser in (play_parser, tournament_parser):
+        variant_parser.add_argument("--rows", type=int, default=NUM_ROWS)
+        variant_parser.add_argument("--columns", type=int, default=NUM_COLUMNS)
+        variant_parser.add_argument(
+            "--connect",
+            type=int,
+            default=CONNECT_LENGTH,
+            help="number of pieces in a row that wins",
+        )
+
+    options = parser.parse_args(arguments)
+    variant = None
+    if options.command in ("play", "tournament"):
+        try:
+            variant = get_variant(options.rows, options.columns, options.connect)
+        except ValueError as error:
+            parser.error(str(error))
+    if options.command == "play":
+        main(options.delay, options.record, variant)
+    elif options.command == "book":
+        written = generate_opening_book(
+            options.output, options.plies, options.time_limit
+        )
+        print("Wrote " + str(written) + " positions to " + options.output)
+    elif options.command == "tournament":
+        try:
+            result = run_tournament(
+                options.first,
+                options.second,
+                options.games,
+                options.workers,
+                options.seed,
+                options.record,
+                variant,
+                options.hard_cache,
+            )
+        except ValueError as error:
+            parser.error(str(error))
+        print_tournament_result(options.first, options.second, result)
+    elif options.command == "solve":
+        game = Game()
+        try:
+            for move in options.moves:
+                game.apply_move(int(move))
+        except ValueError as error:
+            parser.error(str(error))
+        print_board(game.board)
+        start = time.perf_counter()
+        score, column = solve(game.board, game.player, SolverCache(options.cache))
+        if score > 0:
+            outcome = "Player " + str(game.player) + " wins"
+        elif score < 0:
+            outcome = "Player " + str(3 - game.player) + " wins"
+        else:
+            outcome = "Draw"
+        print(
+            outcome
+            + " with perfect play (score "
+            + str(score)
+            + "), best column: "
+            + str(column)
+            + " ("
+            + str(round(time.perf_counter() - start, 2))
+            + " seconds)"
+        )
+    elif options.command == "analyze":
+        game = Game()
+        try:
+            for move in options.moves:
+                game.apply_move(int(move))
+        except ValueError as error:
+            parser.error(str(error))
+        print_board(game.board)
+        start = time.perf_counter()
+        scores = analyze_moves(
+            game.board,
+            game.player,
+            options.engine,
+            options.workers,
+            options.depth,
+            options.time_limit,
+            options.playouts,
+        )
+        for column, score in scores.items():
+            print("Column " + str(column) + ": " + str(round(score, 3)))
+        print(
+            "Best column for player "
+            + str(game.player)
+            + ": "
+            + str(max(scores, key=scores.get))
+            + " ("
+            + str(round(time.perf_counter() - start, 2))
+            + " seconds)"
+        )
+    elif options.command == "records":
+        if options.replay is not None:
+            for index, record in enumerate(read_game_records(options.path)):
+                if index == options.replay:
+                    print_board(replay_game_record(record).board)
+                    print("Moves: " + " ".join(str(move) for move in record.moves))
+                    break
+            else:
+                print("The archive has no game " + str(options.replay))
+        else:
+            print_game_record_summary(read_game_records(options.path))
+    elif options.command == "profile":
+        random.seed(options.seed)
+        stats = HardPlayerStats()
+        opponent = get_cpu_players()[options.opponent]
+
+        def measured_hard(board, player):
+            return cpu_player_hard(board, player, stats)
+
+        for game in range(options.games):
+            players = (
+                (measured_hard, opponent)
+                if game % 2 == 0
+                else (opponent, measured_hard)
+            )
+            if options.profile_dir:
+                os.makedirs(options.profile_dir, exist_ok=True)
+                path = os.path.join(options.profile_dir, "game_" + str(game) + ".prof")
+                profile_cpu_game(players[0], players[1], path)
+            else:
+                play_cpu_game(players[0], players[1])
+        print(stats.report())
 
 
 if __name__ == "__main__":
-    main()
+    command_line(sys.argv[1:])
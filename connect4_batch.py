@@ -0,0 +1,258 @@
+"""
+Batch games of Connect 4 with NumPy.
+
+Holds many games as bitboards in NumPy arrays, in the same layout as
+connect4.Bitboard, and advances every game with one set of array
+operations per move. Batched versions of the Easy and Medium CPUs pick
+a move in every game at once, which makes self-play of millions of
+games practical:
+
+    python connect4_batch.py --first medium --second easy --games 1000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from connect4 import NUM_ROWS, NUM_COLUMNS, BITBOARD_HEIGHT, board_to_bitmasks
+
+# bit index of the bottom and the sentinel cell of every column, in the same layout as Bitboard
+COLUMN_BOTTOMS = np.arange(NUM_COLUMNS, dtype=np.uint64) * np.uint64(BITBOARD_HEIGHT)
+COLUMN_TOPS = COLUMN_BOTTOMS + np.uint64(NUM_ROWS)
+# bit shifts that step along a vertical, horizontal and both diagonal lines
+LINE_SHIFTS = tuple(
+    np.uint64(shift)
+    for shift in (1, BITBOARD_HEIGHT, BITBOARD_HEIGHT - 1, BITBOARD_HEIGHT + 1)
+)
+
+
+def has_four_in_a_row(masks):
+    """
+    Checks many bitmasks for four in a row at once, with the same
+    shift-and-AND steps as connect4.has_four_in_a_row.
+
+    :param masks: Pieces of one player per game, uint64 array.
+    :return: Whether each mask contains four in a row, bool array of the same shape.
+    """
+    found = np.zeros(masks.shape, dtype=bool)
+    for shift in LINE_SHIFTS:
+        pairs = masks & (masks >> shift)
+        found |= (pairs & (pairs >> (shift + shift))) != 0
+    return found
+
+
+class BatchGames:
+    """
+    Many games of Connect 4 held as bitboards in NumPy arrays, so a move
+    in every game is one set of array operations instead of a Python loop
+    per board. Finished games are masked out and ignore later moves.
+
+    Columns are passed in starting at 1, the same as drop_piece.
+    """
+
+    def __init__(self, games):
+        """
+        :param games: Number of games to hold, all starting from an empty board, int.
+        """
+        self.games = games
+        # pieces[1] and pieces[2] hold the bitmask of player 1 and player 2 in every game
+        self.pieces = np.zeros((3, games), dtype=np.uint64)
+        # heights holds the bit index of the next free cell of every column
+        self.heights = np.tile(COLUMN_BOTTOMS, (games, 1))
+        self.to_move = np.ones(games, dtype=np.int8)
+        self.moves = np.zeros(games, dtype=np.int64)
+        # result uses the values of end_of_game, 0 while a game is still going
+        self.result = np.zeros(games, dtype=np.int8)
+
+    @classmethod
+    def from_boards(cls, boards, to_move):
+        """
+        Creates a batch from 2D list boards.
+
+        :param boards: The game boards, list of 2D lists of 6x7 dimensions.
+        :param to_move: The player to move in each game, list of ints.
+        :return: The batch of games, BatchGames.
+        """
+        batch = cls(len(boards))
+        for index, board in enumerate(boards):
+            player_1_mask, player_2_mask = board_to_bitmasks(board)
+            batch.pieces[1, index] = player_1_mask
+            batch.pieces[2, index] = player_2_mask
+            for col in range(NUM_COLUMNS):
+                filled = sum(1 for row in board if row[col] != 0)
+                batch.heights[index, col] = col * BITBOARD_HEIGHT + filled
+            batch.moves[index] = sum(1 for row in board for cell in row if cell != 0)
+        batch.to_move[:] = to_move
+        return batch
+
+    def to_boards(self):
+        """
+        Converts every game into the cells of a 2D board.
+
+        :return: Boards with the top row first and 0, 1 or 2 in each cell, int8 array of shape (games, 6, 7).
+        """
+        boards = np.zeros((self.games, NUM_ROWS, NUM_COLUMNS), dtype=np.int8)
+        for col in range(NUM_COLUMNS):
+            for row in range(NUM_ROWS):
+                bit = np.uint64(1 << (col * BITBOARD_HEIGHT + row))
+                boards[:, NUM_ROWS - 1 - row, col] += ((self.pieces[1] & bit) != 0) * 1
+                boards[:, NUM_ROWS - 1 - row, col] += ((self.pieces[2] & bit) != 0) * 2
+        return boards
+
+    def active(self):
+        """
+        :return: Whether each game is still going, bool array.
+        """
+        return self.result == 0
+
+    def legal_moves(self):
+        """
+        :return: Whether each column can be played in each game, bool array of shape (games, 7).
+        """
+        return (self.heights != COLUMN_TOPS) & self.active()[:, None]
+
+    def winning_moves(self, player_masks):
+        """
+        Finds the columns that would connect four for the given pieces.
+
+        :param player_masks: Pieces of the player to check in every game, uint64 array.
+        :return: Whether dropping into each column wins, bool array of shape (games, 7).
+        """
+        legal = self.legal_moves()
+        # heights of full columns point at the sentinel bit, which never forms a line
+        drops = np.left_shift(np.uint64(1), self.heights)
+        return has_four_in_a_row(player_masks[:, None] | drops) & legal
+
+    def drop(self, columns):
+        """
+        Drops a piece for the player to move into the given column of every
+        game still going, then records wins and draws. Games that are over
+        are left unchanged.
+
+        :param columns: The column to play in each game starting at 1, int array.
+        :return: None
+        """
+        games = np.flatnonzero(self.active())
+        if games.size == 0:
+            return
+        cols = np.asarray(columns, dtype=np.int64)[games] - 1
+        heights = self.heights[games, cols]
+        if np.any(heights == COLUMN_TOPS[cols]):
+            raise ValueError("A piece was dropped into a full column")
+        players = self.to_move[games].astype(np.int64)
+        self.pieces[players, games] |= np.left_shift(np.uint64(1), heights)
+        self.heights[games, cols] = heights + np.uint64(1)
+        self.moves[games] += 1
+
+        won = has_four_in_a_row(self.pieces[players, games])
+        self.result[games[won]] = players[won]
+        drawn = ~won & (self.moves[games] == NUM_ROWS * NUM_COLUMNS)
+        self.result[games[drawn]] = 3
+        self.to_move[games] = 3 - players
+
+    def play(self, policy_1, policy_2, rng):
+        """
+        Plays every game to the end.
+
+        :param policy_1: Batch policy of player 1, function of (BatchGames, rng) returning columns.
+        :param policy_2: Batch policy of player 2, function of (BatchGames, rng) returning columns.
+        :param rng: Random number generator passed to the policies, numpy.random.Generator.
+        :return: Result of every game with the values of end_of_game, int8 array.
+        """
+        policies = (None, policy_1, policy_2)
+        while self.active().any():
+            columns = np.zeros(self.games, dtype=np.int64)
+            for player in (1, 2):
+                moving = self.active() & (self.to_move == player)
+                if moving.any():
+                    player_columns = policies[player](self, rng)
+                    columns[moving] = player_columns[moving]
+            self.drop(columns)
+        return self.result
+
+
+def first_true_column(choices):
+    """
+    :param choices: Columns to choose between in every game, bool array of shape (games, 7).
+    :return: The leftmost chosen column starting at 1, or 0 where none is chosen, int array.
+    """
+    return np.where(choices.any(axis=1), choices.argmax(axis=1) + 1, 0)
+
+
+def batch_cpu_player_easy(games, rng):
+    """
+    Picks a random legal column in every game, like cpu_player_easy.
+
+    :param games: The games to move in, BatchGames.
+    :param rng: Random number generator, numpy.random.Generator.
+    :return: Column for every game starting at 1, or 0 for games that are over, int array.
+    """
+    legal = games.legal_moves()
+    # the legal column with the highest random weight is a uniform pick among them
+    weights = rng.random(legal.shape) * legal
+    return np.where(legal.any(axis=1), weights.argmax(axis=1) + 1, 0)
+
+
+def batch_cpu_player_medium(games, rng):
+    """
+    Picks the first column that wins in every game, else the first
+    column that blocks an immediate win of the opponent, else a random
+    one, like cpu_player_medium.
+
+    :param games: The games to move in, BatchGames.
+    :param rng: Random number generator, numpy.random.Generator.
+    :return: Column for every game starting at 1, or 0 for games that are over, int array.
+    """
+    indexes = np.arange(games.games)
+    player = games.to_move.astype(np.int64)
+    wins = first_true_column(games.winning_moves(games.pieces[player, indexes]))
+    blocks = first_true_column(games.winning_moves(games.pieces[3 - player, indexes]))
+    return np.where(
+        wins > 0, wins, np.where(blocks > 0, blocks, batch_cpu_player_easy(games, rng))
+    )
+
+
+BATCH_CPU_PLAYERS = {
+    "easy": batch_cpu_player_easy,
+    "medium": batch_cpu_player_medium,
+}
+
+
+def play_batch(games, policy_1, policy_2, seed=None):
+    """
+    Plays a batch of games between two batch policies from empty boards.
+
+    :param games: Number of games to play, int.
+    :param policy_1: Batch policy of player 1.
+    :param policy_2: Batch policy of player 2.
+    :param seed: Seed of the random number generator, int.
+    :return: Result of every game with the values of end_of_game, int8 array.
+    """
+    return BatchGames(games).play(policy_1, policy_2, np.random.default_rng(seed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="connect4_batch.py")
+    parser.add_argument("--first", choices=sorted(BATCH_CPU_PLAYERS), default="medium")
+    parser.add_argument("--second", choices=sorted(BATCH_CPU_PLAYERS), default="easy")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=None)
+    options = parser.parse_args()
+
+    start = time.perf_counter()
+    results = play_batch(
+        options.games,
+        BATCH_CPU_PLAYERS[options.first],
+        BATCH_CPU_PLAYERS[options.second],
+        options.seed,
+    )
+    elapsed = time.perf_counter() - start
+    print(
+        "Player 1 wins: {}  Player 2 wins: {}  Draws: {}".format(
+            int((results == 1).sum()),
+            int((results == 2).sum()),
+            int((results == 3).sum()),
+        )
+    )
+    print("{:.0f} games/min".format(options.games / elapsed * 60))
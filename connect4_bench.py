@@ -0,0 +1,377 @@
+"""
+Benchmarks for the hot paths of connect4.py.
+
+Every benchmark runs on a fixed corpus of positions generated from a
+seed, so two runs on the same machine time the same work. Results are
+written as JSON and can be compared against a saved baseline:
+
+    python -m connect4_bench --output baseline.json
+    python -m connect4_bench --compare baseline.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import connect4
+
+# number of positions in each corpus, and how often every position is timed in a run
+CORPUS_SIZE = 200
+REPEATS = 10
+# number of complete games timed by the game benchmarks
+GAMES = 20
+# number of runs of every benchmark, of which the fastest is reported
+RUNS = 5
+# slowdown, as a fraction of the baseline speed, reported as a regression
+REGRESSION_THRESHOLD = 0.50
+
+
+def build_corpus(seed, min_moves, max_moves, size=CORPUS_SIZE):
+    """
+    Plays random games to build a corpus of unfinished positions.
+
+    :param seed: Seed of the random moves, int.
+    :param min_moves: Fewest pieces on a board in the corpus, int.
+    :param max_moves: Most pieces on a board in the corpus, int.
+    :param size: Number of positions, int.
+    :return: Boards and the player to move on them, list of tuples.
+    """
+    generator = random.Random(seed)
+    corpus = []
+    while len(corpus) < size:
+        board = connect4.create_board()
+        player = 1
+        target = generator.randint(min_moves, max_moves)
+        for _ in range(target):
+            columns = [
+                column
+                for column in range(1, connect4.NUM_COLUMNS + 1)
+                if board[0][column - 1] == 0
+            ]
+            connect4.drop_piece(board, player, generator.choice(columns))
+            player = 3 - player
+            if connect4.end_of_game(board) != 0:
+                break
+        else:
+            corpus.append((board, player))
+    return corpus
+
+
+def time_calls(calls, repeats=REPEATS):
+    """
+    Times every call on its own and measures the memory it allocates.
+    The calls are run once untimed first, so the timings do not include
+    warming up the interpreter and caches.
+
+    :param calls: Pairs of a setup function and the call to time, where
+        the setup result is passed to the call, list of tuples.
+    :param repeats: Number of times to run the list of calls, int.
+    :return: Operations per second, latency percentiles in microseconds and peak allocated bytes, dict.
+    """
+    for setup, call in calls:
+        call(setup())
+
+    latencies = []
+    for _ in range(repeats):
+        for setup, call in calls:
+            argument = setup()
+            start = time.perf_counter_ns()
+            call(argument)
+            latencies.append(time.perf_counter_ns() - start)
+
+    # allocations are measured in a separate pass, since tracing slows every call down
+    tracemalloc.start()
+    allocated = []
+    for setup, call in calls:
+        argument = setup()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        call(argument)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated.append(peak - before)
+    tracemalloc.stop()
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "runs": len(latencies),
+        "ops_per_sec": len(latencies) / (total / 1e9) if total else 0.0,
+        "mean_us": total / len(latencies) / 1000,
+        "p50_us": latencies[len(latencies) // 2] / 1000,
+        "p99_us": latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] / 1000,
+        "alloc_peak_bytes": sum(allocated) / len(allocated),
+    }
+
+
+def copy_of(board):
+    """
+    Creates a setup function for calls that change the board.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :return: A setup function returning a fresh copy of the board.
+    """
+    return lambda: [row[:] for row in board]
+
+
+def seeded_copy_of(board, seed):
+    """
+    Creates a setup function for calls that change the board and make
+    random moves. The random moves are seeded before every call, so every
+    run of the call makes the same moves.
+
+    :param board: The game board, 2D list of 6x7 dimensions.
+    :param seed: Seed of the random moves, int.
+    :return: A setup function returning a fresh copy of the board.
+    """
+
+    def setup():
+        random.seed(seed)
+        return [row[:] for row in board]
+
+    return setup
+
+
+def benchmark_drop_piece(corpus):
+    """
+    Times drop_piece into every open column of every position.
+
+    :param corpus: Boards and the player to move on them, list of tuples.
+    :return: The timings, see time_calls, dict.
+    """
+    calls = []
+    for board, player in corpus:
+        for column in range(1, connect4.NUM_COLUMNS + 1):
+            if board[0][column - 1] == 0:
+                calls.append(
+                    (
+                        copy_of(board),
+                        lambda copy, player=player, column=column: connect4.drop_piece(
+                            copy, player, column
+                        ),
+                    )
+                )
+    return time_calls(calls)
+
+
+def benchmark_board_function(corpus, function):
+    """
+    Times a function that only reads the board on every position.
+
+    :param corpus: Boards and the player to move on them, list of tuples.
+    :param function: The function to time, called with a board and player tuple.
+    :return: The timings, see time_calls, dict.
+    """
+    calls = [
+        (lambda board=board, player=player: (board, player), function)
+        for board, player in corpus
+    ]
+    return time_calls(calls)
+
+
+def benchmark_cpu_move(corpus, cpu_player, seed):
+    """
+    Times one CPU move on a copy of every position.
+
+    :param corpus: Boards and the player to move on them, list of tuples.
+    :param cpu_player: CPU player function to time.
+    :param seed: Seed of the CPU player's random moves, int.
+    :return: The timings, see time_calls, dict.
+    """
+    calls = [
+        (
+            seeded_copy_of(board, seed + number),
+            lambda copy, player=player: cpu_player(copy, player),
+        )
+        for number, (board, player) in enumerate(corpus)
+    ]
+    return time_calls(calls, repeats=1)
+
+
+def benchmark_games(cpu_player_1, cpu_player_2, seed):
+    """
+    Times complete games between two CPU players.
+
+    :param cpu_player_1: CPU player function that moves first.
+    :param cpu_player_2: CPU player function that moves second.
+    :param seed: Seed of the CPU players' random moves, int.
+    :return: The timings, see time_calls, dict.
+    """
+    # the random moves are seeded before every game, so every run plays the same games
+    calls = [
+        (
+            lambda number=number: random.seed(seed + number),
+            lambda _: connect4.play_cpu_game(cpu_player_1, cpu_player_2),
+        )
+        for number in range(GAMES)
+    ]
+    return time_calls(calls, repeats=1)
+
+
+def run_suite(seed):
+    """
+    Runs every benchmark once.
+
+    :param seed: Seed of the position corpora and the CPU players' random moves, int.
+    :return: The timings of every benchmark by name, dict.
+    """
+    empty = [(connect4.create_board(), 1)] * CORPUS_SIZE
+    mid_game = build_corpus(seed, 10, 24)
+    near_full = build_corpus(seed + 1, 34, 40)
+
+    benchmarks = {
+        "drop_piece": lambda: benchmark_drop_piece(mid_game),
+        "end_of_game/empty": lambda: benchmark_board_function(
+            empty, lambda position: connect4.end_of_game(position[0])
+        ),
+        "end_of_game/mid_game": lambda: benchmark_board_function(
+            mid_game, lambda position: connect4.end_of_game(position[0])
+        ),
+        "end_of_game/near_full": lambda: benchmark_board_function(
+            near_full, lambda position: connect4.end_of_game(position[0])
+        ),
+    }
+    for name, function in (
+        ("prevent_two_way_win_from_user", connect4.prevent_two_way_win_from_user),
+        ("form_connect_three", connect4.form_connect_three),
+        ("form_connect_two", connect4.form_connect_two),
+    ):
+        benchmarks[name] = lambda function=function: benchmark_board_function(
+            mid_game, lambda position: function(*position)
+        )
+    benchmarks["cpu_player_medium"] = lambda: benchmark_cpu_move(
+        mid_game, connect4.cpu_player_medium, seed
+    )
+    benchmarks["cpu_player_hard"] = lambda: benchmark_cpu_move(
+        mid_game, connect4.cpu_player_hard, seed
+    )
+    benchmarks["game/hard_vs_medium"] = lambda: benchmark_games(
+        connect4.cpu_player_hard, connect4.cpu_player_medium, seed
+    )
+    benchmarks["game/hard_vs_hard"] = lambda: benchmark_games(
+        connect4.cpu_player_hard, connect4.cpu_player_hard, seed
+    )
+
+    return {name: benchmark() for name, benchmark in benchmarks.items()}
+
+
+def run_benchmarks(seed=0, runs=RUNS):
+    """
+    Runs every benchmark several times and keeps the run of each benchmark
+    with the lowest median latency. Every run starts a new interpreter,
+    since its hash seed and memory layout change the speed of a whole run,
+    and a busy spell on the machine only slows down some of the runs.
+
+    :param seed: Seed of the position corpora and the CPU players' random moves, int.
+    :param runs: Number of runs of every benchmark, int.
+    :return: The results with details of the machine they ran on, dict.
+    """
+    results = {}
+    for _ in range(runs):
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            run = executor.submit(run_suite, seed).result()
+        for name, result in run.items():
+            if name not in results or result["p50_us"] < results[name]["p50_us"]:
+                results[name] = result
+
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": seed,
+            "runs": runs,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "benchmarks": results,
+    }
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Compares results against a baseline and prints the change of every
+    benchmark present in both. The change is measured on the median
+    latency, which a few slow calls on a busy machine do not move.
+
+    :param results: Results of run_benchmarks, dict.
+    :param baseline: Earlier results of run_benchmarks, dict.
+    :param threshold: Slowdown, as a fraction of the baseline speed, that counts as a regression, float.
+    :return: Names of the benchmarks that regressed, list of strings.
+    """
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        # a positive change is a speedup, the same as an increase in operations per second
+        change = baseline["benchmarks"][name]["p50_us"] / result["p50_us"] - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:<32} {:>+8.1%}{}".format(name, change, flag))
+    return regressions
+
+
+def print_results(results):
+    """
+    Prints a table of benchmark results.
+
+    :param results: Results of run_benchmarks, dict.
+    :return: None
+    """
+    print(
+        "{:<32} {:>12} {:>10} {:>10} {:>12}".format(
+            "benchmark", "ops/sec", "p50 us", "p99 us", "alloc bytes"
+        )
+    )
+    for name, result in results["benchmarks"].items():
+        print(
+            "{:<32} {:>12.0f} {:>10.1f} {:>10.1f} {:>12.0f}".format(
+                name,
+                result["ops_per_sec"],
+                result["p50_us"],
+                result["p99_us"],
+                result["alloc_peak_bytes"],
+            )
+        )
+
+
+def main(arguments=None):
+    """
+    Runs the benchmarks from the command line.
+
+    :param arguments: Command line arguments, list of strings, defaults to sys.argv.
+    :return: Exit code, 1 if a regression was found against the baseline, int.
+    """
+    parser = argparse.ArgumentParser(prog="python -m connect4_bench")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against a saved JSON baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    options = parser.parse_args(arguments)
+    if options.runs < 1:
+        parser.error("--runs must be at least 1")
+
+    results = run_benchmarks(options.seed, options.runs)
+    print_results(results)
+    if options.output:
+        with open(options.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print()
+        if compare(results, baseline, options.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
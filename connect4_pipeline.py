@@ -0,0 +1,427 @@
+"""
+Batch position analysis for connect4.py.
+
+Streams positions from files or stdin, one per line, has a CPU engine
+move in every one of them across a pool of worker processes, and
+streams the results out in the order the positions came in. Only a
+fixed number of chunks of positions are handed to the workers at any
+time, and reading waits until the oldest chunk is done, so memory stays
+the same however many positions go through.
+
+A position is either the columns played from the start of the game:
+
+    4453            columns written one after another
+    4 4 10 3        or separated by spaces, for boards wider than 9 columns
+
+or the cells of the board, like the FEN of a chess position:
+
+    7/7/7/7/3o3/2xx3 o
+
+with the rows from the top down separated by /, x for player 1, o for
+player 2 and a number for a run of empty cells, then optionally the
+player to move, x or o. Blank lines and lines starting with # are
+skipped.
+
+Results are written as JSON lines, one per position:
+
+    {"line": 1, "position": "4453", "player": 1, "column": 3}
+
+with a "score" from the solver, a "score" and "depth" from the expert,
+or an "error" when the position cannot be graded. The binary format
+writes a fixed size record per position instead, see BinaryResultWriter.
+
+    python -m connect4_pipeline positions.txt --engine hard --output grades.jsonl
+    zcat archive.txt.gz | python -m connect4_pipeline --engine expert --time-limit 0.05
+"""
+
+import argparse
+import fileinput
+import json
+import os
+import struct
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import connect4
+
+# number of positions sent to a worker at once
+CHUNK_SIZE = 64
+# chunks each worker may have waiting, beyond which no more input is read
+CHUNKS_PER_WORKER = 2
+# the characters of the pieces of each player in a FEN-like position
+FEN_PIECES = {"x": 1, "o": 2}
+FEN_PLAYERS = {"x": 1, "o": 2, "1": 1, "2": 2}
+# what a binary result record holds
+RESULT_MOVE = 0
+RESULT_SCORED = 1
+RESULT_ERROR = 2
+# number of binary result records read from a file at once
+RECORDS_PER_READ = 4096
+
+# a result read back from a binary file: the input line, one of RESULT_MOVE,
+# RESULT_SCORED or RESULT_ERROR, the column played, the depth searched and the score
+BinaryResult = namedtuple("BinaryResult", ["line", "kind", "column", "depth", "score"])
+
+
+def parse_moves(text, variant):
+    """
+    Plays the columns of a move string from the start of a game.
+
+    :param text: Columns one after another, or separated by spaces, string.
+    :param variant: Rules of the game, Variant.
+    :return: The board and the player to move, tuple of a 2D list and an int.
+    :raises ValueError: If a move is not a legal column.
+    """
+    game = connect4.Game(variant)
+    moves = text.split() if " " in text else list(text)
+    for move in moves:
+        if not move.isdigit():
+            raise ValueError("Column " + move + " is not a number")
+        game.apply_move(int(move))
+    return game.board, game.player
+
+
+def parse_fen(text, variant):
+    """
+    Reads the cells of a FEN-like position.
+
+    :param text: Rows from the top down separated by /, then optionally the player to move, string.
+    :param variant: Rules of the game, Variant.
+    :return: The board and the player to move, tuple of a 2D list and an int.
+    :raises ValueError: If the position does not fit the board or cannot be reached in a game.
+    """
+    fields = text.split()
+    rows = fields[0].lower().split("/")
+    if len(rows) != variant.num_rows:
+        raise ValueError("The position needs " + str(variant.num_rows) + " rows")
+    board = []
+    for row_text in rows:
+        row = []
+        empty = ""
+        for char in row_text:
+            if char.isdigit():
+                empty += char
+                continue
+            if empty:
+                row.extend([0] * int(empty))
+                empty = ""
+            if char not in FEN_PIECES:
+                raise ValueError("Unknown cell " + char)
+            row.append(FEN_PIECES[char])
+        if empty:
+            row.extend([0] * int(empty))
+        if len(row) != variant.num_columns:
+            raise ValueError("Every row needs " + str(variant.num_columns) + " cells")
+        board.append(row)
+
+    # pieces fall to the bottom, so no empty cell can be below a piece
+    for row_index in range(variant.num_rows - 1):
+        for col_index in range(variant.num_columns):
+            if board[row_index][col_index] and not board[row_index + 1][col_index]:
+                raise ValueError("A piece is floating above an empty cell")
+    pieces = [sum(row.count(player) for row in board) for player in (1, 2)]
+    if pieces[0] - pieces[1] not in (0, 1):
+        raise ValueError("Player 1 must have as many pieces as player 2 or one more")
+    player = 1 if pieces[0] == pieces[1] else 2
+    if len(fields) > 1 and FEN_PLAYERS.get(fields[1].lower()) != player:
+        raise ValueError("The player to move does not match the pieces")
+    return board, player
+
+
+def grade_position(text, engine, depth=None, time_limit=None, variant=None):
+    """
+    Reads a position and has the engine move in it.
+
+    :param text: The position as a move string or FEN-like, string.
+    :param engine: "solve" or the name of a CPU strategy from connect4.get_cpu_players, string.
+    :param depth: Deepest number of moves the expert searches ahead, int or None.
+    :param time_limit: Seconds the expert or MCTS may search each position, float or None.
+    :param variant: Rules of the game, connect4.Variant or None for the standard game.
+    :return: The player to move, the column played and any score and depth, or the error, dict.
+    """
+    if variant is None:
+        variant = connect4.STANDARD_VARIANT
+    try:
+        if "/" in text:
+            board, player = parse_fen(text, variant)
+        else:
+            board, player = parse_moves(text, variant)
+        if connect4.end_of_game(board, variant) != 0:
+            raise ValueError("The game is already over")
+    except ValueError as error:
+        return {"error": str(error)}
+
+    result = {"player": player}
+    if engine == "solve":
+        score, result["column"] = connect4.solve(board, player)
+        result["score"] = score
+    elif engine == "expert":
+        search_result = connect4.search_position(board, player, depth, time_limit)
+        result["column"] = search_result.column
+        result["score"] = search_result.score
+        result["depth"] = search_result.depth
+    elif engine == "mcts":
+        result["column"] = connect4.cpu_player_mcts(
+            board, player, time_limit=time_limit
+        )
+    else:
+        cpu_player = connect4.get_cpu_players(variant)[engine]
+        result["column"] = cpu_player(board, player)
+    return result
+
+
+def grade_chunk(positions, engine, depth=None, time_limit=None, variant=None):
+    """
+    Grades a chunk of positions, in the worker process that runs it.
+
+    :param positions: Line numbers and positions, list of tuples of int and string.
+    :param engine: "solve" or the name of a CPU strategy from connect4.get_cpu_players, string.
+    :param depth: Deepest number of moves the expert searches ahead, int or None.
+    :param time_limit: Seconds the expert or MCTS may search each position, float or None.
+    :param variant: Rules of the game, connect4.Variant or None for the standard game.
+    :return: The result of every position, list of dicts.
+    """
+    results = []
+    for line, text in positions:
+        result = {"line": line, "position": text}
+        result.update(grade_position(text, engine, depth, time_limit, variant))
+        results.append(result)
+    return results
+
+
+def read_chunks(lines, chunk_size=CHUNK_SIZE):
+    """
+    Groups the positions of the input into chunks, reading it lazily.
+
+    :param lines: The lines of the input, iterable of strings.
+    :param chunk_size: Number of positions in a chunk, int.
+    :return: Chunks of line numbers, counting from 1, and positions, generator of lists of tuples.
+    """
+    chunk = []
+    for line, text in enumerate(lines, 1):
+        text = text.strip()
+        if not text or text.startswith("#"):
+            continue
+        chunk.append((line, text))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def grade_positions(
+    lines,
+    engine="hard",
+    workers=None,
+    depth=None,
+    time_limit=None,
+    variant=None,
+    chunk_size=CHUNK_SIZE,
+):
+    """
+    Grades a stream of positions across a pool of worker processes and
+    yields the results in input order. At most CHUNKS_PER_WORKER chunks
+    per worker are in flight, and the next chunk is only read once the
+    oldest one is done, so neither the input nor the results pile up.
+
+    :param lines: The positions, one per line, iterable of strings.
+    :param engine: "solve" or the name of a CPU strategy from connect4.get_cpu_players, string.
+    :param workers: Number of worker processes, int, defaults to the number of CPUs. With 1 the positions are graded in this process.
+    :param depth: Deepest number of moves the expert searches ahead, int or None.
+    :param time_limit: Seconds the expert or MCTS may search each position, float or None.
+    :param variant: Rules of the game, connect4.Variant or None for the standard game.
+    :param chunk_size: Number of positions sent to a worker at once, int.
+    :return: The result of every position, see grade_position, generator of dicts.
+    :raises ValueError: If the engine is unknown or cannot play the variant.
+    """
+    if variant is None:
+        variant = connect4.STANDARD_VARIANT
+    engines = list(connect4.get_cpu_players(variant))
+    if variant is connect4.STANDARD_VARIANT:
+        engines.append("solve")
+    if engine not in engines:
+        raise ValueError("Unknown engine for this board: " + engine)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    chunks = read_chunks(lines, chunk_size)
+    if workers == 1:
+        for chunk in chunks:
+            yield from grade_chunk(chunk, engine, depth, time_limit, variant)
+        return
+
+    executor = ProcessPoolExecutor(workers, initializer=connect4.start_analysis_worker)
+    try:
+        pending = deque()
+        for chunk in chunks:
+            if len(pending) >= CHUNKS_PER_WORKER * workers:
+                yield from pending.popleft().result()
+            pending.append(
+                executor.submit(grade_chunk, chunk, engine, depth, time_limit, variant)
+            )
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+class BinaryResultWriter:
+    """
+    Writes results as fixed size binary records after a short header:
+    the input line, whether the record holds a move, a move with a
+    score or an error, the column, the depth searched and the score.
+    The position itself and the text of errors are left out, the input
+    line leads back to them.
+    """
+
+    MAGIC = b"C4GP"
+    # magic and format version
+    HEADER = struct.Struct("<4sH")
+    # line, kind of result, column, depth and score
+    RECORD = struct.Struct("<QBBBi")
+    VERSION = 1
+
+    def __init__(self, output):
+        """
+        :param output: Binary file to write to, positioned at its start.
+        """
+        self.output = output
+        output.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+
+    def write(self, result):
+        """
+        :param result: A result of grade_positions, dict.
+        :return: None
+        """
+        if "error" in result:
+            kind = RESULT_ERROR
+        elif "score" in result:
+            kind = RESULT_SCORED
+        else:
+            kind = RESULT_MOVE
+        self.output.write(
+            self.RECORD.pack(
+                result["line"],
+                kind,
+                result.get("column") or 0,
+                result.get("depth", 0),
+                result.get("score", 0),
+            )
+        )
+
+
+def read_binary_results(path):
+    """
+    Reads back the records of a BinaryResultWriter one at a time.
+
+    :param path: Path of the binary results file, string.
+    :return: Every result in the file, generator of BinaryResult.
+    :raises ValueError: If the file is not a binary results file or its last record is cut short.
+    """
+    with open(path, "rb") as results_file:
+        header = results_file.read(BinaryResultWriter.HEADER.size)
+        if len(header) < BinaryResultWriter.HEADER.size:
+            raise ValueError(path + " is not a binary results file")
+        magic, version = BinaryResultWriter.HEADER.unpack(header)
+        if magic != BinaryResultWriter.MAGIC or version != BinaryResultWriter.VERSION:
+            raise ValueError(path + " is not a binary results file")
+        record_size = BinaryResultWriter.RECORD.size
+        while True:
+            block = results_file.read(record_size * RECORDS_PER_READ)
+            if len(block) % record_size:
+                raise ValueError(path + " ends with an incomplete result record")
+            if not block:
+                return
+            for record in BinaryResultWriter.RECORD.iter_unpack(block):
+                yield BinaryResult(*record)
+
+
+def main(arguments=None):
+    """
+    Grades positions from the command line.
+
+    :param arguments: Command line arguments, list of strings, defaults to sys.argv.
+    :return: Exit code, int.
+    """
+    parser = argparse.ArgumentParser(prog="python -m connect4_pipeline")
+    parser.add_argument(
+        "files", nargs="*", help="files of positions, stdin when none or -"
+    )
+    parser.add_argument(
+        "--engine",
+        choices=sorted(list(connect4.get_cpu_players()) + ["solve"]),
+        default="hard",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument(
+        "--time-limit",
+        type=float,
+        default=None,
+        help="seconds the expert or mcts engine may search each position",
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--format", choices=("jsonl", "binary"), default="jsonl")
+    parser.add_argument(
+        "--output", help="file to write the results to, stdout when not given"
+    )
+    parser.add_argument("--rows", type=int, default=connect4.NUM_ROWS)
+    parser.add_argument("--columns", type=int, default=connect4.NUM_COLUMNS)
+    parser.add_argument("--connect", type=int, default=connect4.CONNECT_LENGTH)
+    options = parser.parse_args(arguments)
+
+    try:
+        variant = connect4.get_variant(options.rows, options.columns, options.connect)
+    except ValueError as error:
+        parser.error(str(error))
+
+    binary = options.format == "binary"
+    if options.output:
+        output = open(options.output, "wb" if binary else "w")
+    else:
+        output = sys.stdout.buffer if binary else sys.stdout
+    writer = BinaryResultWriter(output) if binary else None
+
+    start = time.perf_counter()
+    graded = errors = 0
+    with fileinput.input(options.files) as lines:
+        try:
+            results = grade_positions(
+                lines,
+                options.engine,
+                options.workers,
+                options.depth,
+                options.time_limit,
+                variant,
+                options.chunk_size,
+            )
+            for result in results:
+                graded += 1
+                errors += "error" in result
+                if binary:
+                    writer.write(result)
+                else:
+                    output.write(json.dumps(result) + "\n")
+        except ValueError as error:
+            parser.error(str(error))
+        finally:
+            if options.output:
+                output.close()
+            else:
+                output.flush()
+
+    elapsed = time.perf_counter() - start
+    print(
+        "Graded {} positions, {} errors, {:.1f} positions/sec".format(
+            graded, errors, graded / elapsed if elapsed > 0 else 0.0
+        ),
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
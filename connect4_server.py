@@ -0,0 +1,514 @@
+"""
+Asyncio game server for connect4.py.
+
+One process hosts many games at once over TCP. Every connection is a
+session that can play one game after another, either against a CPU
+player, like game_against_cpu, or with both players moving from the
+same connection, like local_2_player_game. CPU moves run in a process
+pool, so a slow hard or expert search never holds up the other sessions.
+
+The protocol is one command per line:
+
+    NEW CPU <difficulty> [1|2]  start a game against the CPU, moving first (1) or second (2)
+    NEW LOCAL                   start a game where this connection moves for both players
+    MOVE <column>               drop a piece for the player to move, columns start at 1
+    BOARD                       show the board of the current game
+    STATS                       show the server metrics
+    QUIT                        close the session
+
+and the server answers with lines of:
+
+    READY                       the connection is open
+    STARTED <player>            a game started, playing as player 1 or 2, or 0 for both
+    MOVED <player> <column>     a piece was dropped
+    TURN <player>               waiting for a move of the player
+    OVER <result>               the game ended, 1 or 2 for the winner, 3 for a draw
+    BOARD <cells>               the 42 cells, top row first, 0 for empty or the player
+    STATS <name>=<value> ...    the server metrics
+    ERROR <message>             the command was not accepted
+
+A line too long for the stream buffer is answered with ERROR and ends
+the session.
+
+Start a server, then load it with the test client:
+
+    python -m connect4_server serve --port 4444
+    python -m connect4_server client --port 4444 --sessions 1000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import connect4
+
+# default address the server listens on and the client connects to
+HOST = "127.0.0.1"
+PORT = 4444
+# number of recent move latencies the percentiles are taken over
+LATENCY_SAMPLES = 10000
+# default seconds between the metrics the server prints, 0 to never print them
+REPORT_INTERVAL = 10.0
+# the columns a MOVE command accepts
+COLUMNS = [str(column) for column in range(1, connect4.NUM_COLUMNS + 1)]
+
+
+def percentile(samples, fraction):
+    """
+    :param samples: Measurements, sorted list of floats.
+    :param fraction: Fraction of the measurements at or below the result, float.
+    :return: The measurement at the fraction, or 0.0 with no measurements, float.
+    """
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def cpu_move(difficulty, board, player):
+    """
+    Plays a CPU move in a worker process.
+
+    :param difficulty: Name of the CPU player in connect4.get_cpu_players, string.
+    :param board: A copy of the game board, 2D list of 6x7 dimensions.
+    :param player: The player the CPU moves for, integer value of 1 or 2.
+    :return: Column that the CPU dropped its piece into, int.
+    """
+    return connect4.get_cpu_players()[difficulty](board, player)
+
+
+class ServerStats:
+    """
+    Counts the sessions and games of a server and keeps the latency of
+    recent moves. The latency of a move runs from reading a MOVE command
+    to having answered it, including the reply of the CPU.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.active_sessions = 0
+        self.sessions = 0
+        self.games_started = 0
+        self.games_finished = 0
+        self.moves = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def record_move(self, seconds):
+        """
+        :param seconds: Time taken to answer a MOVE command, float.
+        :return: None
+        """
+        self.moves += 1
+        self.latencies.append(seconds)
+
+    def summary(self):
+        """
+        :return: The current metrics by name, dict.
+        """
+        uptime = time.perf_counter() - self.start
+        latencies = sorted(self.latencies)
+        return {
+            "active_sessions": self.active_sessions,
+            "sessions": self.sessions,
+            "sessions_per_sec": round(self.sessions / uptime, 1),
+            "games_started": self.games_started,
+            "games_finished": self.games_finished,
+            "games_per_sec": round(self.games_finished / uptime, 1),
+            "moves": self.moves,
+            "move_p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+            "move_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "move_max_ms": round(latencies[-1] * 1000 if latencies else 0.0, 2),
+        }
+
+    def report(self):
+        """
+        :return: The current metrics as name=value pairs, string.
+        """
+        return " ".join(
+            "{}={}".format(name, value) for name, value in self.summary().items()
+        )
+
+
+class Session:
+    """
+    One connection to the server and the game it is playing. A session
+    holds nothing but a connect4.Game and who the CPU plays, so a server
+    can keep thousands of them.
+    """
+
+    def __init__(self, server, reader, writer):
+        """
+        :param server: The server the session belongs to, GameServer.
+        :param reader: Stream of the connection's commands, asyncio.StreamReader.
+        :param writer: Stream of the answers, asyncio.StreamWriter.
+        """
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.game = None
+        # the CPU player's difficulty and player number, None for a local game
+        self.cpu = None
+        self.cpu_player = 0
+
+    def send(self, *words):
+        """
+        :param words: Words of one answer line.
+        :return: None
+        """
+        self.writer.write((" ".join(str(word) for word in words) + "\n").encode())
+
+    async def run(self):
+        """
+        Answers the commands of the connection until it sends QUIT or closes.
+
+        :return: None
+        """
+        self.send("READY")
+        await self.writer.drain()
+        while True:
+            try:
+                line = await self.reader.readline()
+            except (ValueError, asyncio.LimitOverrunError):
+                # the line is longer than the stream buffer, so there is no telling
+                # where the next command starts, and the session is ended
+                self.send("ERROR", "line too long")
+                await self.writer.drain()
+                return
+            if not line:
+                return
+            words = line.decode(errors="replace").split()
+            if not words:
+                continue
+            command = words[0].upper()
+            if command == "QUIT":
+                return
+            if command == "NEW":
+                await self.new_game(words[1:])
+            elif command == "MOVE":
+                start = time.perf_counter()
+                await self.move(words[1:])
+                self.server.stats.record_move(time.perf_counter() - start)
+            elif command == "BOARD":
+                if self.game is None:
+                    self.send("ERROR", "no game started")
+                else:
+                    self.send(
+                        "BOARD",
+                        "".join(str(cell) for row in self.game.board for cell in row),
+                    )
+            elif command == "STATS":
+                self.send("STATS", self.server.stats.report())
+            else:
+                self.send("ERROR", "unknown command", command)
+            await self.writer.drain()
+
+    async def new_game(self, arguments):
+        """
+        Starts a game, and plays the first move when the CPU moves first.
+
+        :param arguments: Words after NEW, list of strings.
+        :return: None
+        """
+        mode = arguments[0].upper() if arguments else ""
+        if mode == "CPU":
+            if len(arguments) < 2 or arguments[1].lower() not in self.server.cpus:
+                self.send(
+                    "ERROR", "difficulty must be one of", *sorted(self.server.cpus)
+                )
+                return
+            first = arguments[2] if len(arguments) > 2 else "1"
+            if first not in ("1", "2"):
+                self.send("ERROR", "player must be 1 or 2")
+                return
+            self.cpu = arguments[1].lower()
+            self.cpu_player = 3 - int(first)
+        elif mode == "LOCAL":
+            self.cpu = None
+            self.cpu_player = 0
+        else:
+            self.send("ERROR", "game must be CPU or LOCAL")
+            return
+
+        self.game = connect4.Game()
+        self.server.stats.games_started += 1
+        self.send("STARTED", 3 - self.cpu_player if self.cpu else 0)
+        await self.next_turn()
+
+    async def move(self, arguments):
+        """
+        Plays the connection's move, then the CPU's reply in a game against the CPU.
+
+        :param arguments: Words after MOVE, list of strings.
+        :return: None
+        """
+        if self.game is None or self.game.result() != 0:
+            self.send("ERROR", "no game in progress")
+            return
+        if self.game.player == self.cpu_player:
+            self.send("ERROR", "not your turn")
+            return
+        if not arguments or arguments[0] not in COLUMNS:
+            self.send("ERROR", "column must be a number from 1 to 7")
+            return
+        column = int(arguments[0])
+        if column not in self.game.legal_moves():
+            self.send("ERROR", "column", column, "is full")
+            return
+        self.play(column)
+        await self.next_turn()
+
+    async def next_turn(self):
+        """
+        Plays the CPU's move if it is the CPU's turn, then tells the
+        connection whose turn it is or how the game ended.
+
+        :return: None
+        """
+        game = self.game
+        if game.result() == 0 and game.player == self.cpu_player:
+            # the worker gets a copy of the board, so the move is applied here
+            column = await asyncio.get_running_loop().run_in_executor(
+                self.server.executor, cpu_move, self.cpu, game.board, game.player
+            )
+            self.play(column)
+        if game.result() != 0:
+            self.send("OVER", game.result())
+        else:
+            self.send("TURN", game.player)
+
+    def play(self, column):
+        """
+        Plays a move for the player to move and announces it.
+
+        :param column: The column to drop the piece into, starting at 1, int.
+        :return: None
+        """
+        self.send("MOVED", self.game.player, column)
+        if self.game.apply_move(column) != 0:
+            self.server.stats.games_finished += 1
+
+
+class GameServer:
+    """
+    Accepts connections and runs a Session for each, with CPU moves
+    played by a shared process pool.
+    """
+
+    def __init__(self, workers=None):
+        """
+        :param workers: Number of processes playing CPU moves, int or None for one per CPU core.
+        """
+        # every worker seeds its own random moves, instead of repeating the parent's
+        self.executor = ProcessPoolExecutor(workers, initializer=random.seed)
+        self.cpus = connect4.get_cpu_players()
+        self.stats = ServerStats()
+
+    async def handle(self, reader, writer):
+        """
+        Runs the session of a new connection until it ends.
+
+        :param reader: Stream of the connection's commands, asyncio.StreamReader.
+        :param writer: Stream of the answers, asyncio.StreamWriter.
+        :return: None
+        """
+        self.stats.sessions += 1
+        self.stats.active_sessions += 1
+        try:
+            await Session(self, reader, writer).run()
+        except ConnectionError:
+            pass
+        finally:
+            self.stats.active_sessions -= 1
+            writer.close()
+
+    async def report(self, interval):
+        """
+        Prints the metrics of the server every interval seconds.
+
+        :param interval: Seconds between reports, float.
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(interval)
+            print(self.stats.report(), flush=True)
+
+    async def serve(self, host=HOST, port=PORT, report_interval=REPORT_INTERVAL):
+        """
+        Listens for connections until cancelled.
+
+        :param host: Address to listen on, string.
+        :param port: Port to listen on, int.
+        :param report_interval: Seconds between printed metrics, or 0 for none, float.
+        :return: None
+        """
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        print("Listening on {}:{}".format(host, port), flush=True)
+        reporter = None
+        if report_interval > 0:
+            reporter = asyncio.ensure_future(self.report(report_interval))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            self.executor.shutdown(cancel_futures=True)
+
+
+async def play_client_session(host, port, games, difficulty, rng, latencies):
+    """
+    Plays games against the server's CPU from one connection, moving
+    into random legal columns.
+
+    :param host: Address of the server, string.
+    :param port: Port of the server, int.
+    :param games: Number of games to play one after another, int.
+    :param difficulty: Difficulty of the server's CPU player, string.
+    :param rng: Source of the client's moves, random.Random.
+    :param latencies: Collects the seconds from sending a move to the next TURN or OVER, list.
+    :return: Results of the games with the values of end_of_game, list of ints.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    results = []
+    try:
+        await reader.readline()
+        for _ in range(games):
+            filled = [0] * connect4.NUM_COLUMNS
+            sent = None
+            writer.write(
+                "NEW CPU {} {}\n".format(difficulty, rng.choice((1, 2))).encode()
+            )
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError("the server closed the connection")
+                words = line.decode().split()
+                if words[0] == "MOVED":
+                    filled[int(words[2]) - 1] += 1
+                    continue
+                if words[0] == "ERROR":
+                    raise RuntimeError(" ".join(words[1:]))
+                if sent is not None and words[0] in ("TURN", "OVER"):
+                    latencies.append(time.perf_counter() - sent)
+                if words[0] == "OVER":
+                    results.append(int(words[1]))
+                    break
+                if words[0] == "TURN":
+                    column = rng.choice(
+                        [
+                            col + 1
+                            for col in range(connect4.NUM_COLUMNS)
+                            if filled[col] < connect4.NUM_ROWS
+                        ]
+                    )
+                    sent = time.perf_counter()
+                    writer.write("MOVE {}\n".format(column).encode())
+        writer.write(b"QUIT\n")
+        await writer.drain()
+    finally:
+        writer.close()
+    return results
+
+
+async def run_clients(
+    host, port, sessions, concurrency, games, difficulty="easy", seed=None
+):
+    """
+    Loads a server with many client sessions, at most concurrency of them at a time.
+
+    :param host: Address of the server, string.
+    :param port: Port of the server, int.
+    :param sessions: Number of connections to make, int.
+    :param concurrency: Most connections open at once, int.
+    :param games: Number of games played by every connection, int.
+    :param difficulty: Difficulty of the server's CPU player, string.
+    :param seed: Seed of the clients' moves, int or None.
+    :return: Sessions per second, games per second and sorted move round trips in seconds, tuple.
+    """
+    rng = random.Random(seed)
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def session():
+        async with slots:
+            return await play_client_session(
+                host, port, games, difficulty, random.Random(rng.random()), latencies
+            )
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(session() for _ in range(sessions)))
+    elapsed = time.perf_counter() - start
+    played = sum(len(result) for result in results)
+    return sessions / elapsed, played / elapsed, sorted(latencies)
+
+
+def main(arguments=None):
+    """
+    Runs the server or the test client from the command line.
+
+    :param arguments: Command line arguments, list of strings, defaults to sys.argv.
+    :return: Exit code, int.
+    """
+    parser = argparse.ArgumentParser(prog="python -m connect4_server")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="host games over TCP")
+    serve_parser.add_argument("--host", default=HOST)
+    serve_parser.add_argument("--port", type=int, default=PORT)
+    serve_parser.add_argument(
+        "--workers", type=int, default=None, help="processes playing CPU moves"
+    )
+    serve_parser.add_argument("--report-interval", type=float, default=REPORT_INTERVAL)
+
+    client_parser = commands.add_parser(
+        "client", help="play random moves against a server and time it"
+    )
+    client_parser.add_argument("--host", default=HOST)
+    client_parser.add_argument("--port", type=int, default=PORT)
+    client_parser.add_argument("--sessions", type=int, default=100)
+    client_parser.add_argument("--concurrency", type=int, default=100)
+    client_parser.add_argument("--games", type=int, default=1, help="games per session")
+    client_parser.add_argument(
+        "--difficulty", choices=sorted(connect4.get_cpu_players()), default="easy"
+    )
+    client_parser.add_argument("--seed", type=int, default=None)
+    options = parser.parse_args(arguments)
+
+    if options.command == "serve":
+        try:
+            asyncio.run(
+                GameServer(options.workers).serve(
+                    options.host, options.port, options.report_interval
+                )
+            )
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    sessions_per_sec, games_per_sec, latencies = asyncio.run(
+        run_clients(
+            options.host,
+            options.port,
+            options.sessions,
+            options.concurrency,
+            options.games,
+            options.difficulty,
+            options.seed,
+        )
+    )
+    print(
+        "{:.1f} sessions/sec  {:.1f} games/sec  move p50 {:.2f} ms  p99 {:.2f} ms".format(
+            sessions_per_sec,
+            games_per_sec,
+            percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.99) * 1000,
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())